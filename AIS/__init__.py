@@ -7,19 +7,50 @@ AIS.py - A Python interface for the Swisscom All-in Signing Service.
 
 """
 from .ais import AIS
-from .pdf import PDF
+from .cache import DirectoryCache, MemoryCache, SigningCache
+from .deadline import Deadline
+from .engine import SigningEngine
+from .pdf import MultiSignaturePDF, PDF
+from .pool import AISPool
+from .scheduler import SigningScheduler
+from .prepared import PreparedPDF, prepare_pdf, prepare_pdfs
+from .profiling import Profiler
+from .sizing import SignatureSizer
+from .template import TemplateCache
+from .tuning import BatchTuner
+from .verify import VerificationResult, verify_pdf, verify_pdfs
 from .exceptions import (
     AISError,
     AuthenticationFailed,
+    DeadlineExceeded,
     SignatureTooLarge,
     UnknownAISError,
 )
 
 __all__ = (
     'AIS',
+    'AISPool',
+    'SigningScheduler',
+    'SigningEngine',
     'PDF',
+    'MultiSignaturePDF',
+    'PreparedPDF',
+    'prepare_pdf',
+    'prepare_pdfs',
+    'TemplateCache',
+    'SigningCache',
+    'MemoryCache',
+    'DirectoryCache',
+    'SignatureSizer',
+    'Deadline',
+    'BatchTuner',
+    'Profiler',
+    'VerificationResult',
+    'verify_pdf',
+    'verify_pdfs',
     'AISError',
     'AuthenticationFailed',
+    'DeadlineExceeded',
     'SignatureTooLarge',
     'UnknownAISError'
 )
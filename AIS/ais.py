@@ -7,25 +7,45 @@ AIS.py - A Python interface for the Swisscom All-in Signing Service.
 
 """
 
-import base64
+from concurrent.futures import ThreadPoolExecutor
 import json
+import time
 import uuid
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from . import exceptions
+from .cache import cache_key
+from .connections import ConnectionHealth
+from .connections import KeepAlive
+from .deadline import Deadline
+from .deadline import timeout_for
+from .pdf import decode_signature
+from .profiling import profile_phase
+from .profiling import profiler_from_env
+from .profiling import Profiler
+from .sizing import SignatureSizer
+from .tracing import span
+from .tuning import BatchTuner
 
 
 from typing import Any
 from typing import Dict
+from typing import List
 from typing import Optional
 from typing import Sequence
+from typing import Tuple
+from typing import Union
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
+    from .cache import SigningCache
+    from .pdf import MultiSignaturePDF
     from .pdf import PDF
 
 
 url = 'https://ais.swisscom.com/AIS-Server/rs/v1.0/sign'
+profile = 'http://ais.swisscom.ch/1.1'
 
 
 class AIS:
@@ -39,13 +59,69 @@ class AIS:
         customer: str,
         key_static: str,
         cert_file: str,
-        cert_key: str
+        cert_key: str,
+        *,
+        cache: Optional['SigningCache'] = None,
+        sig_sizer: Optional[SignatureSizer] = None,
+        memory_budget: Optional[int] = None,
+        batch_tuner: Optional[BatchTuner] = None,
+        url: Optional[str] = None,
+        max_connections: int = 10,
+        profiler: Optional[Profiler] = None
     ):
-        """Initialize an AIS client with authentication information."""
+        """Initialize an AIS client with authentication information.
+
+        :param cache: Optional cache of signed documents. If a document
+        with identical contents has already been signed with the same
+        parameters, the signed version is taken from the cache instead
+        of signing it again.
+
+        :param sig_sizer: Optional :class:`SignatureSizer` that chooses
+        the size reserved for signatures of pdfs created with
+        ``sig_size=None``.
+
+        :param memory_budget: Optional number of bytes the prepared
+        documents of a batch may occupy in memory. Once the budget is
+        exceeded the outputs of the remaining documents are moved to
+        temporary files, see :meth:`PDF.spill`. Their `out_stream` is
+        then no longer a ``BytesIO``, so use :meth:`PDF.signed_bytes`
+        or read the stream instead of calling ``getvalue()``.
+
+        :param batch_tuner: Optional :class:`BatchTuner` that records
+        the latency of every request and splits batches into chunks
+        of the size it considers best.
+
+        :param url: Optional URL of the AIS service to use instead
+        of the default one.
+
+        :param max_connections: The number of connections to AIS kept
+        open for reuse, see :meth:`warm_up`.
+
+        :param profiler: Optional :class:`Profiler` that records the
+        CPU and memory usage of preparing each document and embedding
+        its signature. By default one is used if the ``AIS_PROFILE``
+        environment variable is set.
+        """
         self.customer = customer
         self.key_static = key_static
         self.cert_file = cert_file
         self.cert_key = cert_key
+        self.cache = cache
+        self.sig_sizer = sig_sizer
+        self.memory_budget = memory_budget
+        self.batch_tuner = batch_tuner
+        self.url = url
+        self.max_connections = max_connections
+        self.profiler = profiler or profiler_from_env()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=max_connections)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.health = ConnectionHealth()
+        """The :class:`ConnectionHealth` of the connections to AIS."""
 
         self.last_request_id = None
 
@@ -53,9 +129,125 @@ class AIS:
         self.last_request_id = uuid.uuid4().hex
         return self.last_request_id
 
-    def post(self, payload: str) -> Dict[str, Any]:
+    @property
+    def claimed_identity(self) -> str:
+        """The identity claimed in sign requests."""
+        return ':'.join((self.customer, self.key_static))
+
+    def _cache_key(self, pdf: 'PDF') -> str:
+        return cache_key(pdf, profile=profile,
+                         identity=self.claimed_identity)
+
+    def _load_cached(self, pdfs: Sequence['PDF']) -> List['PDF']:
+        """Restores the pdfs found in the cache and returns the rest."""
+        if self.cache is None:
+            return list(pdfs)
+
+        remaining = []
+        for pdf in pdfs:
+            signed = self.cache.get(self._cache_key(pdf))
+            if signed is None:
+                remaining.append(pdf)
+            else:
+                pdf.load_signed(signed)
+        return remaining
+
+    def _store_cached(self, pdfs: Sequence['PDF']) -> None:
+        if self.cache is None:
+            return
+
+        for pdf in pdfs:
+            self.cache.set(self._cache_key(pdf), pdf.signed_bytes())
+
+    def _digest(self, pdf: 'PDF') -> str:
+        if (
+            pdf.adaptive_sig_size
+            and self.sig_sizer is not None
+            and pdf.prepared_digest is None
+        ):
+            pdf.sig_size = self.sig_sizer.reserve()
+        return pdf.digest()
+
+    def _digest_all(self, pdfs: Sequence['PDF']) -> List[str]:
+        digests = []
+        buffered = 0
+        for index, pdf in enumerate(pdfs):
+            with span('ais.digest', {'ais.document_index': index}), \
+                    profile_phase(self.profiler, 'ais.digest', pdf):
+                digests.append(self._digest(pdf))
+            if self.memory_budget is not None:
+                buffered += pdf.buffered_size
+                if buffered > self.memory_budget:
+                    buffered -= pdf.spill()
+        return digests
+
+    def _write_signature(
+        self,
+        pdf: 'PDF',
+        signature: bytes,
+        resize: bool
+    ) -> bool:
+        """Writes the signature and returns whether that succeeded.
+
+        If the signature doesn't fit and the pdf allows it, the pdf
+        is prepared again with a larger `sig_size`.
+        """
+        signature_size = len(signature)*2  # account for hex encoding
+        if self.sig_sizer is not None:
+            self.sig_sizer.observe(signature_size)
+
+        try:
+            pdf.write_signature(signature)
+        except exceptions.SignatureTooLarge:
+            if not resize or not pdf.adaptive_sig_size:
+                raise
+
+            sizer = self.sig_sizer or SignatureSizer()
+            pdf.reset(max(sizer.reserve(), sizer.padded(signature_size)))
+            return False
+        return True
+
+    def _sign(
+        self,
+        pdfs: Sequence['PDF'],
+        deadline: Optional[Deadline],
+        resize: bool = True
+    ) -> None:
+        # no need to prepare the documents if we're out of time anyway
+        if deadline is not None:
+            deadline.check()
+
+        # Let's not be pedantic and allow a batch of size 1
+        if len(pdfs) == 1:
+            resized = self._sign_one_pdf(pdfs[0], deadline, resize)
+        else:
+            resized = self._sign_batch(pdfs, deadline, resize)
+
+        # the signature covers the byte range around the placeholder,
+        # so only the documents which didn't fit are signed again
+        if resized:
+            self._sign(resized, deadline, resize=False)
+
+    def post(
+        self,
+        payload: str,
+        *,
+        deadline: Union[Deadline, float, None] = None,
+        batch_size: int = 1
+    ) -> Dict[str, Any]:
         """ Do the post request for this payload and return the signature part
         of the json response.
+
+        :param deadline: Optional :class:`Deadline` or number of seconds
+        the request may take at most.
+
+        :param batch_size: The number of documents signed by this request,
+        the read timeout is scaled accordingly.
+
+        :raises: :class:`DeadlineExceeded`: If the deadline has expired
+        before the request is sent. A response that arrives after the
+        deadline is still returned, check :attr:`Deadline.expired`
+        before starting further work.
         """
 
         headers = {
@@ -63,86 +255,252 @@ class AIS:
             'Content-Type': 'application/json;charset=UTF-8',
         }
         cert = (self.cert_file, self.cert_key)
-        response = requests.post(url, data=payload, headers=headers,
-                                 cert=cert, timeout=(10, 5))
-        sign_resp = response.json()['SignResponse']
-        result = sign_resp['Result']
-        if 'Error' in result['ResultMajor']:
-            raise exceptions.error_for(response)
+        deadline = Deadline.of(deadline)
+        timeout = timeout_for(batch_size, deadline)
+        start = time.perf_counter()
+        try:
+            with span('ais.request.http', {'ais.batch_size': batch_size}):
+                response = self.session.post(self.url or url, data=payload,
+                                             headers=headers, cert=cert,
+                                             timeout=timeout)
+        except requests.RequestException as error:
+            self.health.record(error)
+            # let the tuner know this batch size was too much
+            if self.batch_tuner is not None and isinstance(
+                error, requests.Timeout
+            ):
+                self.batch_tuner.record(
+                    batch_size, time.perf_counter() - start, 0, failed=True)
+            raise
+
+        if self.batch_tuner is not None:
+            self.batch_tuner.record(
+                batch_size,
+                time.perf_counter() - start,
+                len(response.content)
+            )
+
+        try:
+            with span('ais.response.parse'):
+                sign_resp = response.json()['SignResponse']
+            result = sign_resp['Result']
+            failed = 'Error' in result['ResultMajor']
+            failure = exceptions.error_for(response) if failed else None
+        except Exception as error:
+            # e.g. a proxy answering with an HTML error page
+            self.health.record(error)
+            raise
+
+        if failure is not None:
+            # most errors concern the request, not the connection, which
+            # is only unhealthy if AIS fails or rejects the client
+            if response.status_code >= 500 or isinstance(
+                failure, exceptions.AuthenticationFailed
+            ):
+                self.health.record(failure)
+            else:
+                self.health.record()
+            raise failure
+        self.health.record()
+
+        # the timeouts only limit the individual socket operations, so
+        # the response may arrive after the deadline. It is returned
+        # anyway, the signatures are valid and discarding them would
+        # only waste them, the next request fails on the deadline.
         return sign_resp
 
-    def sign_batch(self, pdfs: Sequence['PDF']) -> None:
-        """Sign a batch of files."""
+    def _head(
+        self,
+        timeout: float,
+        stream: bool = False
+    ) -> Optional[requests.Response]:
+        """Sends a HEAD request to AIS and records the outcome."""
+        start = time.perf_counter()
+        try:
+            with span('ais.request.probe'):
+                response = self.session.head(
+                    self.url or url,
+                    cert=(self.cert_file, self.cert_key),
+                    timeout=timeout,
+                    stream=stream
+                )
+            # the service only accepts sign requests, any other response
+            # proves the connection is established and authenticated
+            status = response.status_code
+            if status in (401, 403) or status >= 500:
+                response.close()
+                raise requests.HTTPError(
+                    f'{status} response to probe', response=response)
+        except requests.RequestException as error:
+            self.health.record(error)
+            return None
+
+        self.health.record(latency=time.perf_counter() - start)
+        return response
+
+    def probe(self, *, timeout: float = 10.0) -> bool:
+        """Sends a lightweight request to AIS over one of the pooled
+        connections and returns whether it succeeded.
+
+        The outcome is recorded in :attr:`health`.
+        """
+        return self._head(timeout) is not None
+
+    def warm_up(
+        self,
+        connections: Optional[int] = None,
+        *,
+        timeout: float = 10.0
+    ) -> int:
+        """Opens and authenticates connections to AIS ahead of time.
+
+        The first request otherwise pays for DNS resolution and the
+        TLS handshake with the client certificate. The connections
+        are probed concurrently, so each probe uses a connection of
+        its own. Connections which are already open are reused, so
+        this may be called repeatedly to keep them alive.
+
+        :param connections: The number of connections to open, by
+        default `max_connections`.
+
+        :param timeout: The timeout of each probe in seconds.
+
+        :returns: The number of connections that could be opened.
+        """
+        if connections is None:
+            connections = self.max_connections
+        count = min(connections, self.max_connections)
+        if count <= 0:
+            return 0
+        with ThreadPoolExecutor(max_workers=count) as executor:
+            responses = list(executor.map(
+                lambda _: self._head(timeout, stream=True), range(count)))
+
+        # the connections are only returned to the pool once all of
+        # them are open, otherwise the probes might share them
+        opened = 0
+        for response in responses:
+            if response is not None:
+                response.content
+                opened += 1
+        return opened
+
+    def keep_alive(
+        self,
+        interval: float = 30.0,
+        connections: Optional[int] = None
+    ) -> KeepAlive:
+        """Keeps connections open by probing them periodically.
+
+        Servers and load balancers close idle connections, which
+        causes the first request after a quiet period to set them up
+        again. This calls :meth:`warm_up` every `interval` seconds
+        from a background thread::
+
+            client.warm_up()
+            with client.keep_alive():
+                serve()
+
+        :returns: A :class:`KeepAlive`, which stops probing once
+        stopped or exited.
+        """
+        return KeepAlive(lambda: self.warm_up(connections), interval)
+
+    def close(self) -> None:
+        """Closes the pooled connections."""
+        self.session.close()
+
+    def sign_batch(
+        self,
+        pdfs: Sequence['PDF'],
+        *,
+        deadline: Union[Deadline, float, None] = None
+    ) -> None:
+        """Sign a batch of files.
+
+        :param deadline: Optional :class:`Deadline` or number of seconds
+        for signing the entire batch, including any documents that
+        need to be signed again.
+
+        :raises: :class:`DeadlineExceeded`: If the deadline has expired.
+        """
+
+        pdfs = self._load_cached(pdfs)
 
         # Let's just return if the batch is empty somehow
         if not pdfs:
             return
 
-        # Let's not be pedantic and allow a batch of size 1
-        if len(pdfs) == 1:
-            return self.sign_one_pdf(pdfs[0])
+        if self.batch_tuner is None:
+            self._sign(pdfs, Deadline.of(deadline))
+        else:
+            self._sign_chunked(pdfs, Deadline.of(deadline))
+        self._store_cached(pdfs)
 
-        payload_documents = {
-            'DocumentHash': [
-                {
-                    '@ID': index,
-                    'dsig.DigestMethod': {
-                        '@Algorithm': 'http://www.w3.org/2001/04/xmlenc#sha256'
-                    },
-                    'dsig.DigestValue': pdf.digest()
-                }
-                for index, pdf in enumerate(pdfs)
-            ]
-        }
+    def sign_fields(
+        self,
+        documents: Sequence['MultiSignaturePDF'],
+        *,
+        deadline: Union[Deadline, float, None] = None
+    ) -> None:
+        """Sign documents into several signature fields each.
 
-        payload = {
-            'SignRequest': {
-                '@RequestID': self._request_id(),
-                '@Profile': 'http://ais.swisscom.ch/1.1',
-                'OptionalInputs': {
-                    'AddTimestamp': {
-                        '@Type': 'urn:ietf:rfc:3161'
-                    },
-                    'AdditionalProfile': [
-                        'http://ais.swisscom.ch/1.0/profiles/batchprocessing'
-                    ],
-                    'ClaimedIdentity': {
-                        'Name': ':'.join((self.customer, self.key_static)),
-                    },
-                    'SignatureType': 'urn:ietf:rfc:3369',
-                    'sc.AddRevocationInformation': {
-                        '@Type': 'BOTH'
-                    },
-                },
-                'InputDocuments': payload_documents
-            }
-        }
+        Since every signature covers the ones before it, the fields of
+        one document can't be signed in the same request. Instead the
+        next field of every document is signed in one batch, so the
+        number of requests only depends on the number of fields.
 
-        payload_json = json.dumps(payload, indent=4)
-        sign_resp = self.post(payload_json)
+        :param deadline: Optional :class:`Deadline` or number of seconds
+        for signing all the fields of all the documents.
 
-        other = sign_resp['SignatureObject']['Other']['sc.SignatureObjects']
-        for signature_object in other['sc.ExtendedSignatureObject']:
-            signature = base64.b64decode(
-                signature_object['Base64Signature']['$']
-            )
-            which_document = int(signature_object['@WhichDocument'])
-            pdfs[which_document].write_signature(signature)
+        :raises: :class:`DeadlineExceeded`: If the deadline has expired.
+        """
+        deadline = Deadline.of(deadline)
+        while True:
+            signing = []
+            pdfs: List['PDF'] = []
+            for document in documents:
+                pdf = document.pending
+                if pdf is not None:
+                    signing.append(document)
+                    pdfs.append(pdf)
 
-    def sign_one_pdf(self, pdf: 'PDF') -> None:
-        """Sign the given pdf file."""
+            if not pdfs:
+                return
 
-        payload = {
+            self.sign_batch(pdfs, deadline=deadline)
+            for document in signing:
+                document.mark_signed()
+
+    def _sign_chunked(
+        self,
+        pdfs: Sequence['PDF'],
+        deadline: Optional[Deadline]
+    ) -> None:
+        assert self.batch_tuner is not None
+        start = 0
+        while start < len(pdfs):
+            end = start + self.batch_tuner.batch_size()
+            self._sign(pdfs[start:end], deadline)
+            start = end
+
+    def _payload(
+        self,
+        request_id: str,
+        document_hashes: List[Dict[str, Any]],
+        additional_profiles: List[str]
+    ) -> Dict[str, Any]:
+        return {
             'SignRequest': {
-                '@RequestID': self._request_id(),
-                '@Profile': 'http://ais.swisscom.ch/1.1',
+                '@RequestID': request_id,
+                '@Profile': profile,
                 'OptionalInputs': {
                     'AddTimestamp': {
                         '@Type': 'urn:ietf:rfc:3161'
                     },
-                    'AdditionalProfile': [],
+                    'AdditionalProfile': additional_profiles,
                     'ClaimedIdentity': {
-                        'Name': ':'.join((self.customer, self.key_static)),
+                        'Name': self.claimed_identity,
                     },
                     'SignatureType': 'urn:ietf:rfc:3369',
                     'sc.AddRevocationInformation': {
@@ -150,19 +508,209 @@ class AIS:
                     },
                 },
                 'InputDocuments': {
-                    'DocumentHash': [{
+                    'DocumentHash': document_hashes
+                }
+            }
+        }
+
+    def _request_batch(
+        self,
+        request_id: str,
+        digests: Sequence[str],
+        deadline: Optional[Deadline]
+    ) -> List[Tuple[int, str]]:
+        """Requests the signatures for a batch of digests and returns
+        the index of the digest and the base64 encoded signature.
+        """
+        with span('ais.request.build', {'ais.request_id': request_id}):
+            payload = self._payload(
+                request_id,
+                [
+                    {
+                        '@ID': index,
                         'dsig.DigestMethod': {
                             '@Algorithm':
                                 'http://www.w3.org/2001/04/xmlenc#sha256'
                         },
-                        'dsig.DigestValue': pdf.digest()
-                    }],
-                }
-            }
-        }
+                        'dsig.DigestValue': digest
+                    }
+                    for index, digest in enumerate(digests)
+                ],
+                ['http://ais.swisscom.ch/1.0/profiles/batchprocessing']
+            )
+            payload_json = json.dumps(payload, indent=4)
+
+        sign_resp = self.post(payload_json, deadline=deadline,
+                              batch_size=len(digests))
+
+        signature_objects = sign_resp['SignatureObject']['Other'][
+            'sc.SignatureObjects']['sc.ExtendedSignatureObject']
+        return [
+            (
+                int(signature_object['@WhichDocument']),
+                signature_object['Base64Signature']['$']
+            )
+            for signature_object in signature_objects
+        ]
+
+    def _request_one(
+        self,
+        request_id: str,
+        digest: str,
+        deadline: Optional[Deadline]
+    ) -> str:
+        """Requests the signature for a single digest and returns the
+        base64 encoded signature.
+        """
+        with span('ais.request.build', {'ais.request_id': request_id}):
+            payload = self._payload(
+                request_id,
+                [{
+                    'dsig.DigestMethod': {
+                        '@Algorithm':
+                            'http://www.w3.org/2001/04/xmlenc#sha256'
+                    },
+                    'dsig.DigestValue': digest
+                }],
+                []
+            )
+            payload_json = json.dumps(payload)
+
+        sign_response = self.post(payload_json, deadline=deadline)
+        return sign_response['SignatureObject']['Base64Signature']['$']
+
+    def _sign_batch(
+        self,
+        pdfs: Sequence['PDF'],
+        deadline: Optional[Deadline],
+        resize: bool
+    ) -> List['PDF']:
+
+        request_id = self._request_id()
+        with span('ais.sign', {
+            'ais.request_id': request_id,
+            'ais.batch_size': len(pdfs),
+        }):
+            digests = self._digest_all(pdfs)
+            signatures = self._request_batch(request_id, digests, deadline)
+
+            resized = []
+            for index, encoded in signatures:
+                with span('ais.embed', {
+                    'ais.request_id': request_id,
+                    'ais.document_index': index,
+                }):
+                    pdf = pdfs[index]
+                    with profile_phase(self.profiler, 'ais.embed', pdf):
+                        signature = decode_signature(encoded)
+                        written = self._write_signature(
+                            pdf, signature, resize)
+                    if not written:
+                        resized.append(pdf)
+            return resized
+
+    def sign_digests(
+        self,
+        digests: Sequence[str],
+        *,
+        deadline: Union[Deadline, float, None] = None
+    ) -> List[bytes]:
+        """Sign digests of documents prepared elsewhere.
+
+        This is meant for documents prepared in other processes, see
+        :class:`SigningEngine`. Neither the cache nor the signature
+        sizer are used.
+
+        :param digests: The base64 encoded SHA-256 digests as returned
+        by :meth:`PDF.digest`.
+
+        :param deadline: Optional :class:`Deadline` or number of seconds
+        for the request.
+
+        :returns: The DER encoded signatures in the order of the digests.
+
+        :raises: :class:`DeadlineExceeded`: If the deadline has expired.
+
+        :raises: :class:`UnknownAISError`: If the response lacks the
+        signature of a digest.
+        """
+        deadline = Deadline.of(deadline)
+        if deadline is not None:
+            deadline.check()
+
+        if not digests:
+            return []
+
+        request_id = self._request_id()
+        with span('ais.sign', {
+            'ais.request_id': request_id,
+            'ais.batch_size': len(digests),
+        }):
+            if len(digests) == 1:
+                encoded = self._request_one(request_id, digests[0], deadline)
+                return [decode_signature(encoded)]
+
+            signatures: List[Optional[bytes]] = [None] * len(digests)
+            for index, encoded in self._request_batch(
+                request_id, digests, deadline
+            ):
+                signatures[index] = decode_signature(encoded)
+
+            missing = [
+                index for index, signature in enumerate(signatures)
+                if signature is None
+            ]
+            if missing:
+                raise exceptions.UnknownAISError(
+                    f'No signatures for the digests {missing}')
+            return [
+                signature for signature in signatures
+                if signature is not None
+            ]
+
+    def sign_one_pdf(
+        self,
+        pdf: 'PDF',
+        *,
+        deadline: Union[Deadline, float, None] = None
+    ) -> None:
+        """Sign the given pdf file.
+
+        :param deadline: Optional :class:`Deadline` or number of seconds
+        for signing the file.
+
+        :raises: :class:`DeadlineExceeded`: If the deadline has expired.
+        """
+
+        if not self._load_cached([pdf]):
+            return
+
+        self._sign([pdf], Deadline.of(deadline))
+        self._store_cached([pdf])
+
+    def _sign_one_pdf(
+        self,
+        pdf: 'PDF',
+        deadline: Optional[Deadline],
+        resize: bool
+    ) -> List['PDF']:
+
+        request_id = self._request_id()
+        with span('ais.sign', {
+            'ais.request_id': request_id,
+            'ais.batch_size': 1,
+        }):
+            with span('ais.digest', {'ais.document_index': 0}), \
+                    profile_phase(self.profiler, 'ais.digest', pdf):
+                digest = self._digest(pdf)
+
+            encoded = self._request_one(request_id, digest, deadline)
 
-        sign_response = self.post(json.dumps(payload))
-        signature = base64.b64decode(
-            sign_response['SignatureObject']['Base64Signature']['$']
-        )
-        pdf.write_signature(signature)
+            with span('ais.embed', {
+                'ais.request_id': request_id,
+                'ais.document_index': 0,
+            }), profile_phase(self.profiler, 'ais.embed', pdf):
+                signature = decode_signature(encoded)
+                if not self._write_signature(pdf, signature, resize):
+                    return [pdf]
+            return []
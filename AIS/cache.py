@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+AIS.py - A Python interface for the Swisscom All-in Signing Service.
+
+:copyright: (c) 2016 by Camptocamp
+:license: AGPLv3, see README and LICENSE for more details
+
+"""
+
+from collections import OrderedDict
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+
+from typing import Optional
+from typing import Tuple
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from .pdf import PDF
+
+
+def cache_key(pdf: 'PDF', *, profile: str, identity: str) -> str:
+    """Returns the cache key for signing `pdf` with the given parameters.
+
+    The key is derived from the contents of the unsigned document, the
+    signature field name and size (unless the size is chosen by the
+    client), the output options, the AIS profile and the claimed
+    identity, so the same document signed with a different key will
+    never be served from the cache.
+    """
+    perms = pdf.docmdp_perms
+    options = '{}:{}'.format(
+        'approval' if perms is None else perms.name,
+        'compact' if pdf.compact else 'regular'
+    )
+    md = hashlib.sha256()
+    for part in (
+        pdf.content_hash(),
+        pdf.sig_name,
+        'adaptive' if pdf.adaptive_sig_size else str(pdf.sig_size),
+        options,
+        profile,
+        identity,
+    ):
+        md.update(part.encode('utf-8'))
+        md.update(b'\0')
+    return md.hexdigest()
+
+
+class SigningCache:
+    """Base class for caches of signed documents.
+
+    A cache maps keys as returned by :func:`cache_key` to the
+    entire contents of the signed PDF.
+    """
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Returns the signed PDF for `key` or `None` on a cache miss."""
+        raise NotImplementedError
+
+    def set(self, key: str, data: bytes) -> None:
+        """Stores the signed PDF for `key`, evicting old entries."""
+        raise NotImplementedError
+
+
+class MemoryCache(SigningCache):
+    """Least recently used in-memory cache of signed documents.
+
+    :param max_entries: Maximum number of signed documents to keep.
+
+    :param max_bytes: Optional maximum total size of the signed
+    documents to keep.
+
+    :param max_age: Optional maximum age of an entry in seconds.
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = 128,
+        max_bytes: Optional[int] = None,
+        max_age: Optional[float] = None
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+        self._entries: 'OrderedDict[str, Tuple[float, bytes]]'
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            created, data = entry
+            if self.max_age is not None:
+                if time.time() - created > self.max_age:
+                    self._remove(key)
+                    return None
+
+            self._entries.move_to_end(key)
+            return data
+
+    def set(self, key: str, data: bytes) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (time.time(), data)
+            self._size += len(data)
+            self._evict()
+
+    def _remove(self, key: str) -> None:
+        _, data = self._entries.pop(key)
+        self._size -= len(data)
+
+    def _evict(self) -> None:
+        while self._entries and (
+            (
+                self.max_entries is not None
+                and len(self._entries) > self.max_entries
+            ) or (
+                self.max_bytes is not None
+                and self._size > self.max_bytes
+            )
+        ):
+            self._remove(next(iter(self._entries)))
+
+
+class DirectoryCache(SigningCache):
+    """Cache storing signed documents as files in a directory.
+
+    Entries are evicted based on their last access time, so this is
+    also a least recently used cache. The directory may be shared
+    between processes.
+
+    :param path: The directory to store the signed documents in. It
+    will be created if it does not exist yet.
+
+    Scanning the directory for entries to evict is expensive for large
+    caches, so it is only done when the total size tracked by this
+    instance exceeds `max_bytes`, and otherwise every `scan_every`
+    inserts. The scan evicts entries until the total size is below
+    `low_watermark` times `max_bytes`, so the next scan is only needed
+    after a number of inserts.
+
+    :param max_bytes: Optional maximum total size of the files.
+
+    :param max_age: Optional maximum age of an entry in seconds.
+
+    :param scan_every: Number of inserts after which the directory is
+    scanned regardless of its size. This evicts expired entries and
+    picks up entries written by other processes.
+    """
+
+    suffix = '.pdf'
+
+    low_watermark = 0.9
+    """Share of `max_bytes` a scan evicts down to."""
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: Optional[int] = None,
+        max_age: Optional[float] = None,
+        scan_every: int = 1000
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.scan_every = scan_every
+        os.makedirs(path, exist_ok=True)
+
+        # the total size as of the last scan plus the inserts since,
+        # unknown until the first scan
+        self._size: Optional[int] = None
+        self._inserts = 0
+        self._lock = threading.Lock()
+
+    def _path_for(self, key: str) -> str:
+        return os.path.join(self.path, key + self.suffix)
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path_for(key)
+        try:
+            stat = os.stat(path)
+            if self.max_age is not None:
+                if time.time() - stat.st_mtime > self.max_age:
+                    os.remove(path)
+                    return None
+
+            with open(path, 'rb') as fp:
+                data = fp.read()
+
+            # the access time is used for eviction, the modification
+            # time records when the entry was created
+            os.utime(path, (time.time(), stat.st_mtime))
+        except FileNotFoundError:
+            return None
+        return data
+
+    def set(self, key: str, data: bytes) -> None:
+        path = self._path_for(key)
+        try:
+            replaced = os.stat(path).st_size
+        except FileNotFoundError:
+            replaced = 0
+
+        # write to a temporary file first so concurrent readers never
+        # see a partially written entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        if self.max_bytes is None and self.max_age is None:
+            return
+
+        with self._lock:
+            self._inserts += 1
+            if self._size is not None:
+                self._size += len(data) - replaced
+            due = (
+                self._size is None
+                or self._inserts >= self.scan_every
+                or (self.max_bytes is not None and self._size > self.max_bytes)
+            )
+            if due:
+                self._evict()
+
+    def _evict(self) -> None:
+        limit = None
+        if self.max_bytes is not None:
+            limit = self.max_bytes * self.low_watermark
+
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.path):
+            if not entry.name.endswith(self.suffix):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_atime, stat.st_mtime, stat.st_size,
+                            entry.path))
+
+        total = 0
+        entries.sort(reverse=True)
+        for _, created, size, path in entries:
+            total += size
+            if (
+                self.max_age is not None and now - created > self.max_age
+            ) or (
+                limit is not None and total > limit
+            ):
+                total -= size
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+        self._size = total
+        self._inserts = 0
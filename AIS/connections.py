@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+AIS.py - A Python interface for the Swisscom All-in Signing Service.
+
+:copyright: (c) 2016 by Camptocamp
+:license: AGPLv3, see README and LICENSE for more details
+
+"""
+
+import threading
+import time
+
+
+from typing import Any
+from typing import Callable
+from typing import Optional
+
+
+class ConnectionHealth:
+    """The health of the connections of an :class:`AIS` client.
+
+    Updated by every request and probe, meant to be exported to
+    monitoring or used by readiness checks.
+
+    A request only counts as failed if it doesn't reach AIS, if AIS
+    answers with a server error or something other than JSON, or if
+    it rejects the credentials. Errors about the request itself, like
+    an invalid document hash, don't affect the health.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        """Total number of requests and probes."""
+
+        self.errors = 0
+        """Total number of failed requests and probes."""
+
+        self.failures = 0
+        """Number of consecutive failed requests and probes."""
+
+        self.last_success: Optional[float] = None
+        """Time of the last successful request or probe."""
+
+        self.last_error: Optional[BaseException] = None
+        """The error of the last failed request or probe."""
+
+        self.latency: Optional[float] = None
+        """The latency of the last successful probe in seconds."""
+
+    @property
+    def healthy(self) -> bool:
+        """Whether the last request or probe succeeded."""
+        return self.failures == 0 and self.last_success is not None
+
+    def idle_time(self) -> Optional[float]:
+        """Seconds since the last successful request or probe."""
+        if self.last_success is None:
+            return None
+        return self.clock() - self.last_success
+
+    def record(
+        self,
+        error: Optional[BaseException] = None,
+        latency: Optional[float] = None
+    ) -> None:
+        with self._lock:
+            self.requests += 1
+            if error is not None:
+                self.errors += 1
+                self.failures += 1
+                self.last_error = error
+                return
+
+            self.failures = 0
+            self.last_success = self.clock()
+            if latency is not None:
+                self.latency = latency
+
+
+class KeepAlive:
+    """Periodically calls a probe from a daemon thread.
+
+    Returned by :meth:`AIS.keep_alive`, call :meth:`stop` or use it as
+    a context manager to stop probing.
+    """
+
+    def __init__(self, probe: Callable[[], Any], interval: float):
+        self.probe = probe
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> 'KeepAlive':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self.probe()
+            except Exception:
+                # the outcome is recorded in the connection health
+                pass
+
+    def stop(self, wait: bool = True) -> None:
+        """Stops probing."""
+        self._stopped.set()
+        if wait:
+            self._thread.join()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+AIS.py - A Python interface for the Swisscom All-in Signing Service.
+
+:copyright: (c) 2016 by Camptocamp
+:license: AGPLv3, see README and LICENSE for more details
+
+"""
+
+import time
+
+from .exceptions import DeadlineExceeded
+
+
+from typing import Callable
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+
+CONNECT_TIMEOUT = 10.0
+"""Connect timeout in seconds used without a deadline."""
+
+READ_TIMEOUT = 5.0
+"""Read timeout in seconds for a single document."""
+
+READ_TIMEOUT_PER_DOCUMENT = 0.05
+"""Additional read timeout in seconds for every further document
+in a batch."""
+
+CONNECT_SHARE = 0.3
+"""Share of the remaining time that may be spent on connecting."""
+
+
+class Deadline:
+    """An overall time budget for one or more requests to AIS.
+
+    The deadline starts counting when it is created. Pass the same
+    instance to multiple calls in order to share the budget between
+    them.
+
+    :param seconds: The number of seconds until the deadline expires.
+    """
+
+    def __init__(
+        self,
+        seconds: float,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.clock = clock
+        self.expires = clock() + seconds
+
+    @classmethod
+    def of(cls, value: Union['Deadline', float, None]) -> Optional['Deadline']:
+        """Accepts either a deadline or the number of seconds."""
+        if value is None or isinstance(value, Deadline):
+            return value
+        return cls(value)
+
+    @property
+    def remaining(self) -> float:
+        """The number of seconds left until the deadline expires."""
+        return self.expires - self.clock()
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining <= 0
+
+    def check(self) -> float:
+        """Returns the remaining time.
+
+        :raises: :class:`DeadlineExceeded`: If the deadline has expired.
+        """
+        remaining = self.remaining
+        if remaining <= 0:
+            raise DeadlineExceeded(-remaining)
+        return remaining
+
+
+def timeout_for(
+    batch_size: int = 1,
+    deadline: Optional[Deadline] = None
+) -> Tuple[float, float]:
+    """Returns the connect and read timeout for a request signing
+    `batch_size` documents.
+
+    The read timeout grows with the size of the batch. If a deadline
+    is given neither timeout will exceed the remaining time and both
+    together will stay within it.
+
+    Note that requests applies the connect timeout to every address it
+    tries and the read timeout to every read from the socket, not to
+    the entire response. A request may therefore take longer than the
+    deadline. :meth:`AIS.post` still returns such a late response, the
+    deadline is enforced before the next request is sent.
+
+    :raises: :class:`DeadlineExceeded`: If the deadline has expired.
+    """
+    connect = CONNECT_TIMEOUT
+    read = READ_TIMEOUT + READ_TIMEOUT_PER_DOCUMENT * max(batch_size - 1, 0)
+    if deadline is None:
+        return connect, read
+
+    remaining = deadline.check()
+    connect = min(connect, remaining * CONNECT_SHARE)
+    read = min(read, remaining - connect)
+    return connect, read
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+AIS.py - A Python interface for the Swisscom All-in Signing Service.
+
+:copyright: (c) 2016 by Camptocamp
+:license: AGPLv3, see README and LICENSE for more details
+
+"""
+
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+import io
+import os
+import tempfile
+
+from .deadline import Deadline
+from .pdf import DEFAULT_SIG_SIZE
+from .pdf import embed_signature
+from .pdf import PDF
+
+
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Set
+from typing import Tuple
+from typing import Union
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from .ais import AIS
+
+
+# the temporary file of a prepared document, its placeholder and digest
+Prepared = Tuple[str, int, int, str]
+
+
+def _file_mode() -> int:
+    """Returns the permissions a newly created file would get."""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _prepare_file(
+    input_path: str,
+    output_path: str,
+    sig_name: str,
+    sig_size: int,
+    compact: bool
+) -> Prepared:
+    # the input is read before anything is written, the output path
+    # may well be the same file
+    with open(input_path, 'rb') as fp:
+        input_stream = io.BytesIO(fp.read())
+
+    # the document is prepared next to the output and only moved into
+    # place once the signature is embedded, a failed run doesn't leave
+    # behind documents with an empty signature
+    fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(output_path)),
+        prefix='.' + os.path.basename(output_path) + '.',
+        suffix='.tmp'
+    )
+    try:
+        os.fchmod(fd, _file_mode())
+        with open(fd, 'w+b') as out_stream:
+            pdf = PDF(
+                input_stream,
+                out_stream=out_stream,
+                sig_name=sig_name,
+                sig_size=sig_size,
+                compact=compact
+            )
+            digest = pdf.digest()
+            assert pdf.prepared_digest is not None
+            return (
+                temp_path,
+                pdf.prepared_digest.reserved_region_start,
+                pdf.prepared_digest.reserved_region_end,
+                digest
+            )
+    except BaseException:
+        _remove(temp_path)
+        raise
+
+
+def _embed_file(
+    temp_path: str,
+    output_path: str,
+    sig_start: int,
+    sig_end: int,
+    signature: bytes
+) -> None:
+    try:
+        with open(temp_path, 'r+b') as out_stream:
+            embed_signature(out_stream, sig_start, sig_end, signature)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        _remove(temp_path)
+        raise
+
+
+class SigningEngine:
+    """Signs files using a pool of worker processes.
+
+    pyHanko is CPU bound, so preparing many documents in threads
+    doesn't scale. The engine prepares and embeds the signatures in
+    worker processes. The digests of all workers are batched into
+    requests by the calling process, which is the only one talking
+    to AIS. This uses every core with a small, fixed number of
+    connections.
+
+    Documents are passed to the workers by filename, only the digests
+    and signatures are sent between the processes.
+
+    :param client: The :class:`AIS` client used to sign the digests.
+
+    :param processes: The number of worker processes, by default the
+    number of CPUs.
+
+    :param batch_size: The number of digests signed per request.
+
+    :param max_connections: The number of concurrent requests to AIS.
+
+    The remaining parameters are the same as for :class:`PDF`, the
+    signature size can't be chosen adaptively.
+    """
+
+    def __init__(
+        self,
+        client: 'AIS',
+        *,
+        processes: Optional[int] = None,
+        batch_size: int = 50,
+        max_connections: int = 2,
+        sig_name: str = 'Signature',
+        sig_size: int = DEFAULT_SIG_SIZE,
+        compact: bool = False
+    ):
+        self.client = client
+        self.processes = processes or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.max_connections = max_connections
+        self.sig_name = sig_name
+        self.sig_size = sig_size
+        self.compact = compact
+
+    def sign_files(
+        self,
+        files: Sequence[Tuple[str, str]],
+        *,
+        deadline: Union[Deadline, float, None] = None
+    ) -> None:
+        """Signs files and writes the signed versions.
+
+        Requests are sent as soon as enough documents are prepared,
+        so preparing, signing and embedding overlap.
+
+        :param files: Pairs of the filename of a document and the
+        filename the signed version is written to.
+
+        :param deadline: Optional :class:`Deadline` or number of seconds
+        for signing all the files.
+
+        The documents are prepared in temporary files next to their
+        output and moved into place once they are signed. The input
+        and the output may be the same file. If signing fails, the
+        outputs of the documents that weren't signed yet are left
+        untouched.
+
+        :raises: :class:`DeadlineExceeded`: If the deadline has expired.
+        """
+        deadline = Deadline.of(deadline)
+        prepared: Dict[int, Prepared] = {}
+        ready: List[int] = []
+        preparing: Dict['Future[Any]', int] = {}
+
+        try:
+            self._sign_files(files, deadline, prepared, ready, preparing)
+        except BaseException:
+            # the executors have shut down, so no worker is still
+            # writing, remove the documents that were never signed
+            for future in preparing:
+                if future.done() and not future.cancelled() \
+                        and future.exception() is None:
+                    prepared[preparing[future]] = future.result()
+            for temp_path, *_ in prepared.values():
+                _remove(temp_path)
+            raise
+
+    def _sign_files(
+        self,
+        files: Sequence[Tuple[str, str]],
+        deadline: Optional[Deadline],
+        prepared: Dict[int, Prepared],
+        ready: List[int],
+        preparing: Dict['Future[Any]', int]
+    ) -> None:
+        with ProcessPoolExecutor(max_workers=self.processes) as workers, \
+                ThreadPoolExecutor(self.max_connections) as connections:
+
+            pending: Set['Future[Any]'] = set()
+            signing: Dict['Future[Any]', List[int]] = {}
+
+            for index, (input_path, output_path) in enumerate(files):
+                future: 'Future[Any]' = workers.submit(
+                    _prepare_file,
+                    input_path,
+                    output_path,
+                    self.sig_name,
+                    self.sig_size,
+                    self.compact
+                )
+                preparing[future] = index
+                pending.add(future)
+
+            def send(batch: List[int]) -> None:
+                digests = [prepared[index][3] for index in batch]
+                request = connections.submit(
+                    self.client.sign_digests, digests, deadline=deadline)
+                signing[request] = batch
+                pending.add(request)
+
+            try:
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if future in preparing:
+                            index = preparing.pop(future)
+                            prepared[index] = future.result()
+                            ready.append(index)
+
+                        elif future in signing:
+                            batch = signing.pop(future)
+                            signatures: List[bytes] = future.result()
+                            for index, signature in zip(batch, signatures):
+                                temp_path, sig_start, sig_end, _ = \
+                                    prepared[index]
+                                pending.add(workers.submit(
+                                    _embed_file,
+                                    temp_path,
+                                    files[index][1],
+                                    sig_start,
+                                    sig_end,
+                                    signature
+                                ))
+
+                        else:
+                            # embedding, only errors are of interest
+                            future.result()
+
+                    # send full batches right away and the rest once
+                    # all the documents are prepared
+                    while len(ready) >= self.batch_size or (
+                        ready and not preparing
+                    ):
+                        send(ready[:self.batch_size])
+                        del ready[:self.batch_size]
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
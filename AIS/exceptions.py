@@ -40,6 +40,14 @@ class SignatureTooLarge(AISError):
         super().__init__(f'{signature_size} bytes')
 
 
+class DeadlineExceeded(AISError):
+    """The deadline for signing expired before the work was done."""
+
+    def __init__(self, overdue: float):
+        self.overdue = overdue
+        super().__init__(f'{overdue:.3f} seconds overdue')
+
+
 class UnknownAISError(AISError):
     """Unknown AIS Error."""
 
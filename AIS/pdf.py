@@ -8,30 +8,148 @@ AIS.py - A Python interface for the Swisscom All-in Signing Service.
 """
 
 import base64
+import binascii
+import dataclasses
 from datetime import datetime
+import hashlib
 import io
+import shutil
+import tempfile
 
+from pyhanko.pdf_utils import generic
 from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
 from pyhanko.sign import fields
 from pyhanko.sign import signers
 from pyhanko.sign.signers import cms_embedder
+from pyhanko.sign.signers.pdf_byterange import PdfByteRangeDigest
+from pyhanko.sign.signers.pdf_byterange import PreparedByteRangeDigest
 
 from .exceptions import SignatureTooLarge
+from .tracing import span
 
 
 from typing import overload
+from typing import Any
 from typing import IO
 from typing import Optional
+from typing import Sequence
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     from .types import FileLike
     from .types import SupportsBinaryRead
 
 
+DEFAULT_SIG_SIZE = 64*1024  # 64 KiB
+
+
 def is_seekable(fp: 'SupportsBinaryRead') -> bool:
     return getattr(fp, 'seekable', lambda: False)()
 
 
+# zeros to fill the unused part of a placeholder with, without
+# allocating them for every signature
+PADDING = memoryview(b'0' * DEFAULT_SIG_SIZE)
+
+
+def decode_signature(encoded: str) -> bytes:
+    """Decodes a base64 encoded signature as returned by AIS."""
+    # unlike base64.b64decode this doesn't copy the string first
+    return binascii.a2b_base64(encoded)
+
+
+def embed_signature(
+    stream: IO[bytes],
+    sig_start: int,
+    sig_end: int,
+    signature: bytes
+) -> None:
+    """Writes the signature into the placeholder between `sig_start`
+    and `sig_end`.
+
+    The rest of the placeholder is filled with zeros, in case it held
+    a larger signature before. In-memory streams are written to
+    directly through their buffer. Like pyHanko, the stream is rewound
+    afterwards, so it can be read right away.
+
+    :raises: :class:`SignatureTooLarge`: If the placeholder is too
+    small to store the entire signature.
+    """
+    signature_size = len(signature)*2  # account for hex encoding
+    if signature_size > sig_end - sig_start - 2:
+        raise SignatureTooLarge(signature_size)
+
+    encoded = binascii.hexlify(signature)
+    start = sig_start + 1  # skip the '<'
+    end = sig_end - 1  # up to the '>'
+    if isinstance(stream, io.BytesIO):
+        with stream.getbuffer() as buffer:
+            buffer[start:start + signature_size] = encoded
+            position = start + signature_size
+            while position < end:
+                size = min(end - position, len(PADDING))
+                buffer[position:position + size] = PADDING[:size]
+                position += size
+        stream.seek(0)
+        return
+
+    stream.seek(start)
+    stream.write(encoded)
+    remaining = end - start - signature_size
+    while remaining > 0:
+        size = min(remaining, len(PADDING))
+        stream.write(PADDING[:size])
+        remaining -= size
+    stream.seek(0)
+
+
+class CompactIncrementalPdfFileWriter(IncrementalPdfFileWriter):
+    """Writes the incremental update as compactly as possible.
+
+    The cross-reference section is written as a compressed stream and
+    the updated objects are packed into a compressed object stream.
+    The signature dictionary is excluded, since the signature is
+    embedded at a fixed offset, as are streams, which may not be
+    part of object streams.
+
+    Encrypted documents are written like with the regular writer.
+
+    This hooks into ``_write_objects``, which is private to pyHanko and
+    was written against pyHanko 0.37.0. :class:`PDF` falls back to the
+    regular writer if a pyHanko release doesn't provide the hook, see
+    :meth:`supported`.
+    """
+
+    @staticmethod
+    def supported() -> bool:
+        """Whether the installed pyHanko provides the methods this
+        writer relies on."""
+        return all(
+            callable(getattr(IncrementalPdfFileWriter, name, None))
+            for name in ('_write_objects', 'prepare_object_stream')
+        )
+
+    def __init__(self, input_stream: Any, **kwargs: Any):
+        super().__init__(input_stream, **kwargs)
+        if self.security_handler is None:
+            # cross-reference streams require PDF 1.5, pyHanko
+            # already requires a newer version to add signatures
+            self.stream_xrefs = True
+
+    def _write_objects(self, stream: Any, object_position_dict: Any) -> None:
+        if self.stream_xrefs and self.security_handler is None:
+            packed = [
+                key for key, obj in self.objects.items()
+                if key[0] == 0
+                and not isinstance(obj, generic.StreamObject)
+                and not isinstance(obj, PdfByteRangeDigest)
+            ]
+            if packed:
+                obj_stream = self.prepare_object_stream()
+                for key in sorted(packed, key=lambda key: key[1]):
+                    obj_stream.add_object(key[1], self.objects.pop(key))
+        super()._write_objects(stream, object_position_dict)
+
+
 class PDF:
     """A container for a PDF file to be signed and the signed version."""
 
@@ -42,7 +160,9 @@ class PDF:
         *,
         out_stream: Optional[IO[bytes]] = ...,
         sig_name: str = ...,
-        sig_size: int = ...
+        sig_size: Optional[int] = ...,
+        compact: bool = ...,
+        docmdp_perms: Optional[fields.MDPPerm] = ...
     ): ...
 
     @overload
@@ -51,7 +171,9 @@ class PDF:
         *,
         inout_stream: IO[bytes],
         sig_name: str = ...,
-        sig_size: int = ...
+        sig_size: Optional[int] = ...,
+        compact: bool = ...,
+        docmdp_perms: Optional[fields.MDPPerm] = ...
     ): ...
 
     def __init__(
@@ -61,7 +183,9 @@ class PDF:
         inout_stream: Optional[IO[bytes]] = None,
         out_stream: Optional[IO[bytes]] = None,
         sig_name: str = 'Signature',
-        sig_size: int = 64*1024,  # 64 KiB
+        sig_size: Optional[int] = DEFAULT_SIG_SIZE,
+        compact: bool = False,
+        docmdp_perms: Optional[fields.MDPPerm] = fields.MDPPerm.NO_CHANGES,
     ):
         """Accepts either a filename or a file-like object.
 
@@ -83,16 +207,31 @@ class PDF:
 
         :param sig_size: Size of the signature in DER encoding
         in bytes. By default 64KiB will be reserved, which should
-        be enough for most cases right now.
+        be enough for most cases right now. Pass `None` to let the
+        :class:`AIS` client choose the size based on the signatures
+        it has received so far, see :class:`SignatureSizer`.
+
+        :param compact: Write the smallest possible incremental update,
+        see :class:`CompactIncrementalPdfFileWriter`. Together with
+        `sig_size=None` this minimises the size of the signed PDF.
+        The output requires a PDF 1.5 capable reader. If the installed
+        pyHanko doesn't support it, the regular update is written.
+
+        :param docmdp_perms: The changes allowed after signing, the
+        document is certified with these permissions. Pass `None` to
+        add an approval signature instead, which is required if the
+        document has already been signed.
         """
 
         in_place = out_stream is None
+        owns_output = out_stream is None
         writer_stream: 'SupportsBinaryRead'
 
         if isinstance(inout_stream, io.BytesIO):
             # in this case we create the signed version in-place
             # so the out_stream will be assigned the in_stream
             writer_stream = inout_stream
+            owns_output = False
             assert out_stream is None
 
         elif input_file is None:
@@ -118,15 +257,33 @@ class PDF:
             # to read the entire file into a buffer as well
             writer_stream = io.BytesIO(input_file.read())
 
-        writer = IncrementalPdfFileWriter(writer_stream)
-        self.cms_writer = cms_embedder.PdfCMSEmbedder().write_cms(
-            field_name=sig_name,
-            writer=writer
-        )
-        """CMS Writer used for embedding the signature"""
-        next(self.cms_writer)
+        self.sig_name = sig_name
+        """Name of the Signature field to use."""
 
-        self.sig_size = sig_size
+        self.in_place = in_place
+        """Whether the signed version is written into the input stream."""
+
+        # at this point the input is always seekable
+        self._input: IO[bytes] = writer_stream  # type: ignore[assignment]
+        # when signing in-place the original document will be overwritten
+        # by the incremental update, so we remember where it ends
+        self._input_size: Optional[int] = None
+        if in_place:
+            assert isinstance(writer_stream, io.BytesIO)
+            with writer_stream.getbuffer() as buffer:
+                self._input_size = buffer.nbytes
+        self._content_hash: Optional[str] = None
+        # only outputs we created ourselves may be replaced
+        self._owns_output = owns_output
+
+        self.prepared_digest: Optional[PreparedByteRangeDigest] = None
+        """The digest and location of the signature placeholder,
+        available after `digest` has been called."""
+
+        self.adaptive_sig_size = sig_size is None
+        """Whether the signature size may be chosen by the client."""
+
+        self.sig_size = sig_size or DEFAULT_SIG_SIZE
         """Number of bytes reserved for the signature.
         It is the caller's responsibility to ensure that this is
         large enough to store the entire signature.
@@ -136,6 +293,17 @@ class PDF:
         years.
         """
 
+        self.compact = compact
+        """Whether the incremental update is written compactly."""
+
+        self.docmdp_perms = docmdp_perms
+        """The permissions the document is certified with, if any."""
+
+        self.signed = False
+        """Whether the signature has been written."""
+
+        self._prepare()
+
         if in_place:
             assert out_stream is None
             assert hasattr(writer_stream, 'write')
@@ -148,14 +316,139 @@ class PDF:
         )
         """Signing I/O setup to be passed to pyHanko"""
 
+    def _prepare(self) -> None:
+        with span('ais.pdf.prepare', {'ais.sig_name': self.sig_name}):
+            writer: IncrementalPdfFileWriter
+            if self.compact and CompactIncrementalPdfFileWriter.supported():
+                writer = CompactIncrementalPdfFileWriter(self._input)
+            else:
+                writer = IncrementalPdfFileWriter(self._input)
+            self.cms_writer = cms_embedder.PdfCMSEmbedder().write_cms(
+                field_name=self.sig_name,
+                writer=writer
+            )
+            """CMS Writer used for embedding the signature"""
+            next(self.cms_writer)
+
+    def reset(self, sig_size: Optional[int] = None) -> None:
+        """Discards the prepared signature so the PDF can be signed again.
+
+        This can be used to sign the document with a larger `sig_size`
+        after :class:`SignatureTooLarge` was raised.
+        """
+        if self.in_place:
+            assert self._input_size is not None
+            self._input.seek(self._input_size)
+            self._input.truncate()
+        else:
+            self.out_stream.seek(0)
+            self.out_stream.truncate()
+
+        if sig_size is not None:
+            self.sig_size = sig_size
+
+        self.prepared_digest = None
+        self.signed = False
+        self._prepare()
+
     @property
     def out_stream(self) -> IO[bytes]:
         """Output stream for the signed PDF."""
         assert self.sig_io_setup.output is not None
         return self.sig_io_setup.output
 
+    @property
+    def buffered_size(self) -> int:
+        """Number of bytes of the output that are held in memory."""
+        out_stream = self.out_stream
+        if not isinstance(out_stream, io.BytesIO):
+            return 0
+        with out_stream.getbuffer() as buffer:
+            return buffer.nbytes
+
+    def spill(self) -> int:
+        """Moves the output from memory to a temporary file.
+
+        Only output streams created by this class are moved, streams
+        passed in by the caller are left alone. Afterwards `out_stream`
+        will be the temporary file, use `signed_bytes` to get the
+        signed PDF.
+
+        `digest` needs to be called first.
+
+        :returns: The number of bytes freed.
+        """
+        assert self.prepared_digest is not None
+        size = self.buffered_size
+        if not size or not self._owns_output:
+            return 0
+
+        out_stream = self.out_stream
+        spilled = tempfile.TemporaryFile()
+        out_stream.seek(0)
+        shutil.copyfileobj(out_stream, spilled)
+        if self.in_place:
+            self._input = spilled
+        self.sig_io_setup = dataclasses.replace(
+            self.sig_io_setup,
+            output=spilled
+        )
+        return size
+
+    def content_hash(self) -> str:
+        """Computes the SHA-256 hash of the unsigned input document.
+
+        The hash is computed once and then remembered, it can be used
+        to identify documents with identical contents.
+        """
+        if self._content_hash is not None:
+            return self._content_hash
+
+        stream = self._input
+        position = stream.seek(0, io.SEEK_CUR)
+        stream.seek(0)
+        remaining = self._input_size
+        md = hashlib.sha256()
+        while remaining is None or remaining > 0:
+            size = 64*1024 if remaining is None else min(remaining, 64*1024)
+            chunk = stream.read(size)
+            if not chunk:
+                break
+            md.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+        stream.seek(position)
+
+        self._content_hash = md.hexdigest()
+        return self._content_hash
+
+    def signed_bytes(self) -> bytes:
+        """Returns the entire contents of the signed PDF."""
+        self.out_stream.seek(0)
+        return self.out_stream.read()
+
+    def load_signed(self, data: bytes) -> None:
+        """Replaces the output with an already signed version of this PDF.
+
+        This is used to restore a signed PDF from a cache, neither
+        `digest` nor `write_signature` should be called afterwards.
+        """
+        out_stream = self.out_stream
+        out_stream.seek(0)
+        out_stream.write(data)
+        out_stream.truncate()
+        self.signed = True
+
     def digest(self) -> str:
-        """Computes the PDF digest."""
+        """Computes the PDF digest.
+
+        The document is only prepared once, calling this again returns
+        the same digest until `reset` is called.
+        """
+        if self.prepared_digest is not None:
+            result = base64.b64encode(self.prepared_digest.document_digest)
+            return result.decode('ascii')
+
         sig_obj = signers.SignatureObject(
             timestamp=datetime.now(),
             bytes_reserved=self.sig_size,
@@ -165,13 +458,17 @@ class PDF:
                 sig_placeholder=sig_obj,
                 mdp_setup=cms_embedder.SigMDPSetup(
                     md_algorithm='sha256',
-                    certify=True,
-                    docmdp_perms=fields.MDPPerm.NO_CHANGES,
+                    certify=self.docmdp_perms is not None,
+                    docmdp_perms=self.docmdp_perms,
                 )
             )
         )
         digest, out_stream = self.cms_writer.send(self.sig_io_setup)
         assert out_stream is self.out_stream
+        # we fill in the signature ourselves, so the writer and the
+        # document it holds on to can be released
+        self.cms_writer.close()
+        self.prepared_digest = digest
 
         result = base64.b64encode(digest.document_digest)
 
@@ -185,8 +482,124 @@ class PDF:
         :raises: :class:`SignatureTooLarge`: If sig_size is
         too small to store the entire signature.
         """
-        signature_size = len(signature)*2  # account for hex encoding
-        if signature_size > self.sig_size:
-            raise SignatureTooLarge(signature_size)
+        assert self.prepared_digest is not None
+        if len(signature)*2 > self.sig_size:
+            # account for hex encoding
+            raise SignatureTooLarge(len(signature)*2)
+
+        embed_signature(
+            self.out_stream,
+            self.prepared_digest.reserved_region_start,
+            self.prepared_digest.reserved_region_end,
+            signature
+        )
+        self.signed = True
+
+
+class MultiSignaturePDF:
+    """A PDF to be signed into several signature fields.
+
+    Each signature covers the signatures added before it, so the
+    fields are signed one after another, without re-opening the
+    document in between. Pass many documents to
+    :meth:`AIS.sign_fields` to sign the same field of all of them in
+    a single request.
+
+    The first signature certifies the document with `docmdp_perms`,
+    which need to allow adding further signatures, the others are
+    approval signatures.
+
+    :param sig_names: The names of the signature fields, in the order
+    they are signed.
+
+    The other parameters are the same as for :class:`PDF`, the
+    document is always signed in-place.
+    """
+
+    @overload
+    def __init__(
+        self,
+        input_file: 'FileLike',
+        *,
+        sig_names: Sequence[str],
+        sig_size: Optional[int] = ...,
+        compact: bool = ...,
+        docmdp_perms: Optional[fields.MDPPerm] = ...
+    ): ...
+
+    @overload
+    def __init__(
+        self,
+        *,
+        inout_stream: io.BytesIO,
+        sig_names: Sequence[str],
+        sig_size: Optional[int] = ...,
+        compact: bool = ...,
+        docmdp_perms: Optional[fields.MDPPerm] = ...
+    ): ...
+
+    def __init__(
+        self,
+        input_file: Optional['FileLike'] = None,
+        *,
+        inout_stream: Optional[io.BytesIO] = None,
+        sig_names: Sequence[str],
+        sig_size: Optional[int] = DEFAULT_SIG_SIZE,
+        compact: bool = False,
+        docmdp_perms: Optional[fields.MDPPerm] = fields.MDPPerm.FILL_FORMS,
+    ):
+        if not sig_names:
+            raise ValueError('At least one signature field is required')
+        if docmdp_perms == fields.MDPPerm.NO_CHANGES and len(sig_names) > 1:
+            raise ValueError('NO_CHANGES forbids any further signatures')
+
+        if inout_stream is not None:
+            stream = inout_stream
+        elif input_file is None:
+            raise ValueError('Either input_file or in_stream needs to be set')
+        elif isinstance(input_file, str):
+            with open(input_file, 'rb') as fp:
+                stream = io.BytesIO(fp.read())
+        else:
+            stream = io.BytesIO(input_file.read())
+
+        self.out_stream = stream
+        """Stream containing the document, signed in-place."""
+
+        self.sig_names = list(sig_names)
+        """Names of the signature fields, in the order they are signed."""
+
+        self.signed = 0
+        """Number of fields signed so far."""
+
+        self.sig_size = sig_size
+        self.compact = compact
+        self.docmdp_perms = docmdp_perms
+        self._pending: Optional[PDF] = None
+
+    @property
+    def pending(self) -> Optional[PDF]:
+        """The :class:`PDF` of the next field to be signed, or `None`
+        once all fields are signed.
+        """
+        if self.signed >= len(self.sig_names):
+            return None
+        if self._pending is None:
+            self._pending = PDF(
+                inout_stream=self.out_stream,
+                sig_name=self.sig_names[self.signed],
+                sig_size=self.sig_size,
+                compact=self.compact,
+                docmdp_perms=self.docmdp_perms if not self.signed else None
+            )
+        return self._pending
+
+    def mark_signed(self) -> None:
+        """Records that the pending field has been signed."""
+        assert self._pending is not None
+        self._pending = None
+        self.signed += 1
 
-        self.cms_writer.send(signature)
+    def signed_bytes(self) -> bytes:
+        """Returns the entire contents of the signed PDF."""
+        return self.out_stream.getvalue()
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+AIS.py - A Python interface for the Swisscom All-in Signing Service.
+
+:copyright: (c) 2016 by Camptocamp
+:license: AGPLv3, see README and LICENSE for more details
+
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import requests
+
+from . import exceptions
+from .deadline import Deadline
+
+
+from typing import Callable
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Union
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from .ais import AIS
+    from .pdf import PDF
+
+
+# errors which are likely caused by the endpoint or the credentials
+# of a member, rather than the documents being signed
+member_errors = (
+    requests.RequestException,
+    exceptions.AuthenticationFailed,
+    exceptions.UnknownAISError,
+)
+
+
+class PoolMember:
+    """An :class:`AIS` client in a pool together with its health."""
+
+    def __init__(self, client: 'AIS'):
+        self.client = client
+
+        self.outstanding = 0
+        """Number of requests currently in progress."""
+
+        self.requests = 0
+        """Total number of requests."""
+
+        self.errors = 0
+        """Total number of failed requests."""
+
+        self.failures = 0
+        """Number of consecutive failed requests."""
+
+        self.ejected_until = 0.0
+        """Time until the member is not used, unless all members are
+        ejected."""
+
+    def ejected(self, now: float) -> bool:
+        return now < self.ejected_until
+
+
+class AISPool:
+    """Spreads sign requests across multiple :class:`AIS` clients.
+
+    The clients may use different endpoints (see the `url` argument
+    of :class:`AIS`) and different credentials. Each request is sent
+    to the member with the least outstanding requests. Members that
+    fail repeatedly are ejected for a while and failed requests are
+    retried on another member.
+
+    The pool is meant to be shared between threads.
+
+    :param clients: The clients to spread the requests across.
+
+    :param max_failures: Number of consecutive failures after which
+    a member is ejected.
+
+    :param ejection_time: Number of seconds an ejected member is not
+    used.
+
+    :param retries: Number of times a failed request is retried on
+    another member. By default every member is tried once.
+    """
+
+    def __init__(
+        self,
+        clients: Sequence['AIS'],
+        *,
+        max_failures: int = 3,
+        ejection_time: float = 30.0,
+        retries: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        if not clients:
+            raise ValueError('At least one client is required')
+
+        self.members = [PoolMember(client) for client in clients]
+        self.max_failures = max_failures
+        self.ejection_time = ejection_time
+        self.retries = len(clients) - 1 if retries is None else retries
+        self.clock = clock
+        self._lock = threading.Lock()
+
+    def _acquire(self, exclude: List[PoolMember]) -> PoolMember:
+        with self._lock:
+            now = self.clock()
+            candidates = [
+                member for member in self.members
+                if member not in exclude
+            ] or self.members
+            healthy = [
+                member for member in candidates
+                if not member.ejected(now)
+            ]
+            if healthy:
+                member = min(healthy, key=lambda m: (
+                    m.outstanding, m.requests))
+            else:
+                # rather than failing outright we give the member
+                # the earliest chance to have recovered
+                member = min(candidates, key=lambda m: m.ejected_until)
+
+            member.outstanding += 1
+            member.requests += 1
+            return member
+
+    def _release(self, member: PoolMember, failed: bool) -> None:
+        with self._lock:
+            member.outstanding -= 1
+            if not failed:
+                member.failures = 0
+                return
+
+            member.errors += 1
+            member.failures += 1
+            if member.failures >= self.max_failures:
+                member.ejected_until = self.clock() + self.ejection_time
+
+    def _call(
+        self,
+        sign: Callable[['AIS', Optional[Deadline]], None],
+        deadline: Optional[Deadline]
+    ) -> None:
+        tried: List[PoolMember] = []
+        while True:
+            member = self._acquire(tried)
+            try:
+                sign(member.client, deadline)
+            except member_errors:
+                self._release(member, failed=True)
+                tried.append(member)
+                if len(tried) > self.retries:
+                    raise
+                continue
+            except BaseException:
+                self._release(member, failed=False)
+                raise
+
+            self._release(member, failed=False)
+            return
+
+    def sign_one_pdf(
+        self,
+        pdf: 'PDF',
+        *,
+        deadline: Union[Deadline, float, None] = None
+    ) -> None:
+        """Sign the given pdf file using one of the members.
+
+        :param deadline: Optional :class:`Deadline` or number of seconds
+        for signing the file, including retries.
+        """
+        self._call(
+            lambda client, deadline: client.sign_one_pdf(
+                pdf, deadline=deadline),
+            Deadline.of(deadline)
+        )
+
+    def sign_batch(
+        self,
+        pdfs: Sequence['PDF'],
+        *,
+        deadline: Union[Deadline, float, None] = None,
+        chunk_size: Optional[int] = None
+    ) -> None:
+        """Sign a batch of files.
+
+        :param deadline: Optional :class:`Deadline` or number of seconds
+        for signing the entire batch, including retries.
+
+        :param chunk_size: If given, the batch is split into chunks of
+        this size which are signed concurrently by the members.
+        """
+        deadline = Deadline.of(deadline)
+        if chunk_size is None or len(pdfs) <= chunk_size:
+            def sign(client: 'AIS', deadline: Optional[Deadline]) -> None:
+                # a failed attempt may have signed some of the documents
+                # already, those must not be signed again
+                unsigned = [pdf for pdf in pdfs if not pdf.signed]
+                if unsigned:
+                    client.sign_batch(unsigned, deadline=deadline)
+
+            self._call(sign, deadline)
+            return
+
+        chunks = [
+            pdfs[start:start + chunk_size]
+            for start in range(0, len(pdfs), chunk_size)
+        ]
+        with ThreadPoolExecutor(max_workers=len(self.members)) as executor:
+            futures = [
+                executor.submit(self.sign_batch, chunk, deadline=deadline)
+                for chunk in chunks
+            ]
+            for future in futures:
+                future.result()
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+AIS.py - A Python interface for the Swisscom All-in Signing Service.
+
+:copyright: (c) 2016 by Camptocamp
+:license: AGPLv3, see README and LICENSE for more details
+
+"""
+
+import base64
+import hashlib
+import io
+import re
+import shutil
+
+from pyhanko.sign.signers.pdf_byterange import PreparedByteRangeDigest
+
+from .pdf import DEFAULT_SIG_SIZE
+from .pdf import PDF
+from .profiling import profile_phase
+from .profiling import profiler_from_env
+from .profiling import Profiler
+from .tracing import span
+
+
+from typing import IO
+from typing import Iterable
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from .types import FileLike
+
+
+BYTE_RANGE_RE = re.compile(
+    rb'/ByteRange\s*\[\s*(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s*\]'
+)
+
+
+def prepare_pdf(
+    input_file: 'FileLike',
+    *,
+    out_stream: Optional[IO[bytes]] = None,
+    sig_name: str = 'Signature',
+    sig_size: int = DEFAULT_SIG_SIZE,
+    compact: bool = False,
+    profiler: Optional[Profiler] = None
+) -> IO[bytes]:
+    """Adds the signature field and an empty signature to a PDF.
+
+    This can be done when the document is generated, the resulting
+    PDF is then signed with :class:`PreparedPDF`, which only needs
+    to hash the byte range and embed the signature.
+
+    Note that the signing time stored in the signature dictionary
+    will be the time of the preparation. The timestamp added by AIS
+    is not affected by this.
+
+    The parameters are the same as for :class:`PDF`.
+
+    :param profiler: Optional :class:`Profiler` that records the cost
+    of the preparation as the ``ais.digest`` phase. By default one is
+    used if the ``AIS_PROFILE`` environment variable is set.
+
+    :returns: The stream containing the prepared PDF.
+    """
+    pdf = PDF(
+        input_file,
+        out_stream=out_stream,
+        sig_name=sig_name,
+        sig_size=sig_size,
+        compact=compact
+    )
+    with profile_phase(profiler or profiler_from_env(), 'ais.digest', pdf):
+        pdf.digest()
+    out_stream = pdf.out_stream
+    out_stream.seek(0)
+    return out_stream
+
+
+def prepare_pdfs(
+    input_files: Iterable['FileLike'],
+    *,
+    sig_name: str = 'Signature',
+    sig_size: int = DEFAULT_SIG_SIZE,
+    compact: bool = False,
+    profiler: Optional[Profiler] = None
+) -> Iterator[IO[bytes]]:
+    """Prepares multiple PDFs for signing, see :func:`prepare_pdf`."""
+    for input_file in input_files:
+        yield prepare_pdf(
+            input_file,
+            sig_name=sig_name,
+            sig_size=sig_size,
+            compact=compact,
+            profiler=profiler
+        )
+
+
+def find_placeholder(stream: IO[bytes]) -> Tuple[int, int]:
+    """Returns the start and end of the empty signature added last.
+
+    The ``/ByteRange`` of that signature needs to cover the entire
+    document except for the ``/Contents`` placeholder.
+
+    :raises: :class:`ValueError`: If the PDF contains no signature
+    placeholder or if the signature has already been filled in.
+    """
+    end_of_file = stream.seek(0, io.SEEK_END)
+    window = 64*1024
+    while True:
+        start = max(0, end_of_file - window)
+        stream.seek(start)
+        tail = stream.read()
+        byte_range = None
+        for match in BYTE_RANGE_RE.finditer(tail):
+            byte_range = tuple(int(value) for value in match.groups())
+
+        # the signature we are looking for is part of the last update
+        # but we may have cut it off, so we need to make sure the
+        # byte range actually extends to the end of the file
+        if byte_range is not None:
+            first, first_size, second, second_size = byte_range
+            if second + second_size == end_of_file and first == 0:
+                break
+
+        if start == 0:
+            raise ValueError('No signature placeholder found')
+        window *= 4
+
+    sig_start, sig_end = first_size, second
+    stream.seek(sig_start)
+    if stream.read(3) != b'<00':
+        raise ValueError('The signature placeholder is not empty')
+    stream.seek(sig_end - 1)
+    if stream.read(1) != b'>':
+        raise ValueError('Invalid signature placeholder')
+    return sig_start, sig_end
+
+
+def digest_byte_range(
+    stream: IO[bytes],
+    sig_start: int,
+    sig_end: int
+) -> bytes:
+    """Computes the SHA-256 hash of the stream except for the region
+    between `sig_start` and `sig_end`.
+    """
+    md = hashlib.sha256()
+    if isinstance(stream, io.BytesIO):
+        # these are memoryviews, so no copies are made
+        with stream.getbuffer() as buffer:
+            md.update(buffer[:sig_start])
+            md.update(buffer[sig_end:])
+        return md.digest()
+
+    chunk_size = 64*1024
+    stream.seek(0)
+    remaining = sig_start
+    while remaining > 0:
+        chunk = stream.read(min(remaining, chunk_size))
+        if not chunk:
+            break
+        md.update(chunk)
+        remaining -= len(chunk)
+
+    stream.seek(sig_end)
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        md.update(chunk)
+    return md.digest()
+
+
+class PreparedPDF(PDF):
+    """A PDF which already contains an empty signature.
+
+    Use :func:`prepare_pdf` to add the signature ahead of time. Since
+    the document structure is already in place, pyHanko isn't needed
+    to sign the document and the costly parsing of the PDF is skipped.
+
+    The arguments are the same as for :class:`PDF`, but `sig_size`
+    is determined by the existing placeholder and `sig_name` is
+    only used to identify the signature in caches.
+
+    :raises: :class:`ValueError`: If the PDF has not been prepared.
+    """
+
+    def _prepare(self) -> None:
+        self.adaptive_sig_size = False
+        with span('ais.pdf.prepare', {'ais.sig_name': self.sig_name}):
+            sig_start, sig_end = find_placeholder(self._input)
+        self.sig_size = sig_end - sig_start - 2
+        self._placeholder = (sig_start, sig_end)
+
+    def digest(self) -> str:
+        """Computes the PDF digest."""
+        if self.prepared_digest is not None:
+            return super().digest()
+
+        if not self.in_place:
+            # the placeholder is filled in a copy of the document
+            out_stream = self.out_stream
+            self._input.seek(0)
+            out_stream.seek(0)
+            shutil.copyfileobj(self._input, out_stream)
+            out_stream.truncate()
+
+        sig_start, sig_end = self._placeholder
+        self.prepared_digest = PreparedByteRangeDigest(
+            document_digest=digest_byte_range(
+                self.out_stream, sig_start, sig_end),
+            reserved_region_start=sig_start,
+            reserved_region_end=sig_end
+        )
+
+        result = base64.b64encode(self.prepared_digest.document_digest)
+        return result.decode('ascii')
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+AIS.py - A Python interface for the Swisscom All-in Signing Service.
+
+:copyright: (c) 2016 by Camptocamp
+:license: AGPLv3, see README and LICENSE for more details
+
+"""
+
+import atexit
+import cProfile
+from contextlib import contextmanager
+from contextlib import nullcontext
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+
+from typing import Any
+from typing import ContextManager
+from typing import Dict
+from typing import Iterator
+from typing import Optional
+from typing import TextIO
+from typing import Tuple
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from .pdf import PDF
+
+
+# documents are grouped by their size in powers of four, starting with
+# documents of up to 64 KiB
+SIZE_BUCKETS = tuple(64*1024 * 4**exponent for exponent in range(6))
+
+
+def size_bucket(size: Optional[int]) -> str:
+    """Returns a label for the size group a document falls into."""
+    if size is None:
+        return 'unknown'
+    for limit in SIZE_BUCKETS:
+        if size <= limit:
+            return f'<= {format_size(limit)}'
+    return f'> {format_size(SIZE_BUCKETS[-1])}'
+
+
+def bucket_order(label: str) -> int:
+    """Sorts the labels returned by :func:`size_bucket` by size."""
+    labels = [size_bucket(limit) for limit in SIZE_BUCKETS]
+    labels.append(size_bucket(SIZE_BUCKETS[-1] + 1))
+    if label in labels:
+        return labels.index(label)
+    return len(labels)
+
+
+def format_size(size: float) -> str:
+    for unit in ('B', 'KiB', 'MiB'):
+        if size < 1024:
+            return f'{size:.0f} {unit}'
+        size /= 1024
+    return f'{size:.0f} GiB'
+
+
+def document_size(pdf: 'PDF') -> Optional[int]:
+    """Returns the size of the output of a pdf without the signature
+    placeholder, if it is known."""
+    try:
+        out_stream = pdf.out_stream
+        if isinstance(out_stream, io.BytesIO):
+            with out_stream.getbuffer() as buffer:
+                size = buffer.nbytes
+        else:
+            size = os.fstat(out_stream.fileno()).st_size
+    except Exception:
+        return None
+
+    prepared = pdf.prepared_digest
+    if prepared is not None:
+        size -= prepared.reserved_region_end - prepared.reserved_region_start
+    return size
+
+
+class PhaseStats:
+    """The cost of one phase for documents of similar size."""
+
+    def __init__(self) -> None:
+        self.documents = 0
+        """Number of documents."""
+
+        self.wall_time = 0.0
+        """Total elapsed time in seconds."""
+
+        self.cpu_time = 0.0
+        """Total CPU time of the signing thread in seconds."""
+
+        self.profiled = 0
+        """Number of documents for which memory was traced."""
+
+        self.peak_memory = 0
+        """Largest allocation peak of a single document in bytes."""
+
+        self.total_peak_memory = 0
+        """Sum of the allocation peaks of the traced documents."""
+
+    def record(
+        self,
+        wall_time: float,
+        cpu_time: float,
+        peak_memory: Optional[int]
+    ) -> None:
+        self.documents += 1
+        self.wall_time += wall_time
+        self.cpu_time += cpu_time
+        if peak_memory is not None:
+            self.profiled += 1
+            self.peak_memory = max(self.peak_memory, peak_memory)
+            self.total_peak_memory += peak_memory
+
+
+class Profiler:
+    """Collects the CPU and memory usage of each phase of signing.
+
+    Pass an instance to :class:`AIS` or :func:`prepare_pdfs` to
+    profile the preparation of the documents (``ais.digest``) and the
+    embedding of the signatures (``ais.embed``). For every document
+    the elapsed and CPU time and the allocation peak (using
+    :mod:`tracemalloc`) are recorded, grouped by the size of the
+    document. The calls made during each phase are recorded using
+    :mod:`cProfile`::
+
+        profiler = Profiler()
+        client = AIS(..., profiler=profiler)
+        client.sign_batch(pdfs)
+        profiler.report()
+
+    Setting the ``AIS_PROFILE`` environment variable profiles all
+    clients, see :func:`profiler_from_env`.
+
+    Profiling slows down signing considerably. Since :mod:`cProfile`
+    and :mod:`tracemalloc` can't tell threads apart, only one document
+    at a time is profiled, documents signed concurrently in other
+    threads are only timed.
+
+    :param cpu: Whether to record the calls using :mod:`cProfile`.
+
+    :param memory: Whether to record the allocation peaks using
+    :mod:`tracemalloc`.
+    """
+
+    def __init__(self, *, cpu: bool = True, memory: bool = True):
+        self.cpu = cpu
+        self.memory = memory
+
+        self.stats: Dict[Tuple[str, str], PhaseStats] = {}
+        """The stats by phase and size group."""
+
+        self.profiles: Dict[str, cProfile.Profile] = {}
+        """The recorded calls by phase."""
+
+        self._lock = threading.Lock()
+        self._profiling = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str, pdf: 'PDF') -> Iterator[None]:
+        """Records the cost of a phase for a document."""
+        profiling = self._profiling.acquire(blocking=False)
+        profile = None
+        peak_memory = None
+        try:
+            if profiling and self.memory:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                # reset_peak is only available on Python 3.9+
+                reset_peak = getattr(tracemalloc, 'reset_peak', None)
+                if reset_peak is not None:
+                    reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+            if profiling and self.cpu:
+                with self._lock:
+                    profile = self.profiles.setdefault(
+                        name, cProfile.Profile())
+
+            start = time.perf_counter()
+            start_cpu = time.thread_time()
+            if profile is not None:
+                try:
+                    profile.enable()
+                except ValueError:
+                    # another profiler is active
+                    profile = None
+            try:
+                yield
+            finally:
+                if profile is not None:
+                    profile.disable()
+                wall_time = time.perf_counter() - start
+                cpu_time = time.thread_time() - start_cpu
+                if profiling and self.memory:
+                    peak = tracemalloc.get_traced_memory()[1]
+                    peak_memory = max(0, peak - baseline)
+        finally:
+            if profiling:
+                self._profiling.release()
+
+        key = (name, size_bucket(document_size(pdf)))
+        with self._lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = PhaseStats()
+            stats.record(wall_time, cpu_time, peak_memory)
+
+    def close(self) -> None:
+        """Stops tracing memory allocations."""
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def report(self, file: Optional[TextIO] = None, top: int = 10) -> None:
+        """Writes a summary of the recorded phases.
+
+        For each phase and size group the mean elapsed and CPU time
+        and the allocation peaks per document are listed, followed by
+        the most expensive calls of each phase.
+
+        :param file: The file to write to, by default stderr.
+
+        :param top: The number of functions listed per phase, ordered
+        by their cumulative time.
+        """
+        file = file or sys.stderr
+        row = '{:<12} {:>14} {:>6} {:>10} {:>10} {:>12} {:>12}\n'
+        file.write(row.format(
+            'phase', 'size', 'docs', 'wall ms', 'cpu ms',
+            'mean peak', 'max peak'
+        ))
+
+        with self._lock:
+            stats = sorted(self.stats.items(), key=lambda item: (
+                item[0][0], bucket_order(item[0][1])))
+            profiles = list(self.profiles.items())
+
+        for (name, bucket), phase in stats:
+            if phase.profiled:
+                mean_peak = format_size(
+                    phase.total_peak_memory / phase.profiled)
+                max_peak = format_size(phase.peak_memory)
+            else:
+                mean_peak = max_peak = '-'
+            file.write(row.format(
+                name,
+                bucket,
+                phase.documents,
+                f'{phase.wall_time / phase.documents * 1000:.1f}',
+                f'{phase.cpu_time / phase.documents * 1000:.1f}',
+                mean_peak,
+                max_peak
+            ))
+
+        for name, profile in sorted(profiles):
+            file.write(f'\nCalls during {name}:\n')
+            try:
+                profile_stats = pstats.Stats(profile, stream=file)
+            except TypeError:
+                # nothing has been recorded
+                continue
+            profile_stats.sort_stats('cumulative').print_stats(top)
+
+
+def profile_phase(
+    profiler: Optional[Profiler],
+    name: str,
+    pdf: 'PDF'
+) -> ContextManager[Any]:
+    """Records a phase if a profiler is given, otherwise does nothing."""
+    if profiler is None:
+        return nullcontext()
+    return profiler.phase(name, pdf)
+
+
+_env_profiler: Optional[Profiler] = None
+_env_lock = threading.Lock()
+
+
+def profiler_from_env() -> Optional[Profiler]:
+    """Returns the profiler shared by all clients if the ``AIS_PROFILE``
+    environment variable is set.
+
+    The report is written when the process exits, to stderr if the
+    variable is set to ``1`` or to the file it names otherwise.
+    """
+    global _env_profiler
+    target = os.environ.get('AIS_PROFILE')
+    if not target:
+        return None
+
+    with _env_lock:
+        if _env_profiler is None:
+            _env_profiler = Profiler()
+            atexit.register(_write_report, _env_profiler, target)
+        return _env_profiler
+
+
+def _write_report(profiler: Profiler, target: str) -> None:
+    profiler.close()
+    if target == '1':
+        profiler.report()
+        return
+    with open(target, 'w') as file:
+        profiler.report(file)
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+AIS.py - A Python interface for the Swisscom All-in Signing Service.
+
+:copyright: (c) 2016 by Camptocamp
+:license: AGPLv3, see README and LICENSE for more details
+
+"""
+
+from concurrent.futures import Future
+import heapq
+import itertools
+import threading
+
+from .deadline import Deadline
+
+
+from typing import Any
+from typing import Callable
+from typing import List
+from typing import Sequence
+from typing import Tuple
+from typing import Union
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from .ais import AIS
+    from .pdf import PDF
+    from .pool import AISPool
+
+
+INTERACTIVE = 0
+"""Priority of interactive requests, these are always dispatched first."""
+
+BULK = 10
+"""Priority of bulk requests, these only use the spare capacity."""
+
+
+Task = Tuple[int, int, Callable[[], None], 'Future[None]']
+
+
+class SigningScheduler:
+    """Dispatches sign requests to a client by priority.
+
+    Requests are queued per priority and handed to a fixed number of
+    worker threads, which caps the number of concurrent requests to
+    AIS. Requests with a lower priority value are always dispatched
+    first. Bulk requests (with a priority above :data:`INTERACTIVE`)
+    may never occupy the capacity reserved for interactive requests,
+    so a single document doesn't have to wait for a large batch.
+
+    :param client: The :class:`AIS` client or :class:`AISPool` used
+    to sign the documents.
+
+    :param max_concurrency: The maximum number of concurrent requests.
+
+    :param reserved_interactive: The number of requests reserved for
+    interactive requests.
+
+    :param bulk_chunk_size: Batches submitted with
+    :meth:`submit_batch` are split into chunks of this size, so
+    interactive requests can be dispatched in between.
+    """
+
+    def __init__(
+        self,
+        client: Union['AIS', 'AISPool'],
+        *,
+        max_concurrency: int = 4,
+        reserved_interactive: int = 1,
+        bulk_chunk_size: int = 50
+    ):
+        if not 0 <= reserved_interactive < max_concurrency:
+            raise ValueError(
+                'reserved_interactive must leave room for bulk requests')
+
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.reserved_interactive = reserved_interactive
+        self.bulk_chunk_size = bulk_chunk_size
+
+        self._queue: List[Task] = []
+        self._counter = itertools.count()
+        self._running_bulk = 0
+        self._shutdown = False
+        self._condition = threading.Condition()
+        self._threads = [
+            threading.Thread(target=self._work, daemon=True)
+            for _ in range(max_concurrency)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def __enter__(self) -> 'SigningScheduler':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.shutdown()
+
+    @property
+    def pending(self) -> int:
+        """The number of queued requests."""
+        with self._condition:
+            return len(self._queue)
+
+    def _submit(
+        self,
+        priority: int,
+        function: Callable[[], None]
+    ) -> 'Future[None]':
+        future: 'Future[None]' = Future()
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError('The scheduler has been shut down')
+            heapq.heappush(
+                self._queue,
+                (priority, next(self._counter), function, future)
+            )
+            self._condition.notify()
+        return future
+
+    def _admissible(self) -> bool:
+        if not self._queue:
+            return False
+        priority = self._queue[0][0]
+        if priority <= INTERACTIVE:
+            return True
+        bulk_capacity = self.max_concurrency - self.reserved_interactive
+        return self._running_bulk < bulk_capacity
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                while not self._admissible():
+                    if self._shutdown and not self._queue:
+                        return
+                    self._condition.wait()
+
+                priority, _, function, future = heapq.heappop(self._queue)
+                bulk = priority > INTERACTIVE
+                if bulk:
+                    self._running_bulk += 1
+
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        function()
+                    except BaseException as exception:
+                        future.set_exception(exception)
+                    else:
+                        future.set_result(None)
+            finally:
+                with self._condition:
+                    if bulk:
+                        self._running_bulk -= 1
+                    self._condition.notify_all()
+
+    def submit_one(
+        self,
+        pdf: 'PDF',
+        *,
+        priority: int = INTERACTIVE,
+        deadline: Union[Deadline, float, None] = None
+    ) -> 'Future[None]':
+        """Queues a single document to be signed.
+
+        :param deadline: Optional :class:`Deadline` or number of seconds,
+        the time spent in the queue counts towards it.
+
+        :returns: A future which completes once the document is signed.
+        """
+        deadline = Deadline.of(deadline)
+        return self._submit(
+            priority,
+            lambda: self.client.sign_one_pdf(pdf, deadline=deadline)
+        )
+
+    def submit_batch(
+        self,
+        pdfs: Sequence['PDF'],
+        *,
+        priority: int = BULK,
+        deadline: Union[Deadline, float, None] = None
+    ) -> 'Future[None]':
+        """Queues a batch of documents to be signed in chunks.
+
+        :param deadline: Optional :class:`Deadline` or number of seconds
+        for the entire batch, the time spent in the queue counts
+        towards it.
+
+        :returns: A future which completes once all the documents are
+        signed, or with the first error of any chunk.
+        """
+        deadline = Deadline.of(deadline)
+        result: 'Future[None]' = Future()
+        result.set_running_or_notify_cancel()
+
+        chunks = [
+            pdfs[start:start + self.bulk_chunk_size]
+            for start in range(0, len(pdfs), self.bulk_chunk_size)
+        ]
+        if not chunks:
+            result.set_result(None)
+            return result
+
+        remaining = [len(chunks)]
+        lock = threading.Lock()
+
+        def done(future: 'Future[None]') -> None:
+            with lock:
+                if result.done():
+                    return
+                exception = future.exception()
+                if exception is not None:
+                    result.set_exception(exception)
+                    return
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    result.set_result(None)
+
+        def sign(chunk: Sequence['PDF']) -> Callable[[], None]:
+            return lambda: self.client.sign_batch(chunk, deadline=deadline)
+
+        for chunk in chunks:
+            self._submit(priority, sign(chunk)).add_done_callback(done)
+        return result
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stops the workers once the queued requests are done."""
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
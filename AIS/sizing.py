@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+AIS.py - A Python interface for the Swisscom All-in Signing Service.
+
+:copyright: (c) 2016 by Camptocamp
+:license: AGPLv3, see README and LICENSE for more details
+
+"""
+
+from collections import deque
+import math
+import threading
+
+from .pdf import DEFAULT_SIG_SIZE
+
+
+from typing import Deque
+
+
+class SignatureSizer:
+    """Chooses the number of bytes to reserve for signatures based on
+    the sizes of the signatures that were actually received.
+
+    The size of the signatures returned by AIS mostly depends on the
+    certificate chain and the revocation information that is embedded,
+    so it is quite stable for a given client configuration.
+
+    Pass an instance to :class:`AIS` and create the :class:`PDF` with
+    ``sig_size=None`` to use it.
+
+    :param initial: Number of bytes to reserve as long as no
+    signature has been observed yet.
+
+    :param margin: Relative safety margin added to the largest
+    recently observed signature.
+
+    :param window: Number of recent signatures to consider.
+
+    :param granularity: The reserved size is rounded up to a
+    multiple of this.
+    """
+
+    def __init__(
+        self,
+        initial: int = DEFAULT_SIG_SIZE,
+        margin: float = 0.25,
+        window: int = 100,
+        granularity: int = 1024
+    ):
+        self.initial = initial
+        self.margin = margin
+        self.granularity = granularity
+
+        self._sizes: Deque[int] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, signature_size: int) -> None:
+        """Records the hex encoded size of a received signature."""
+        with self._lock:
+            self._sizes.append(signature_size)
+
+    def padded(self, signature_size: int) -> int:
+        """Returns the size to reserve for a signature of the given size.
+
+        This adds the safety margin and rounds up to the granularity.
+        """
+        size = signature_size * (1 + self.margin)
+        granularity = self.granularity
+        return int(math.ceil(size / granularity) * granularity)
+
+    def reserve(self) -> int:
+        """Returns the number of bytes to reserve for the next signature."""
+        with self._lock:
+            if not self._sizes:
+                return self.initial
+            largest = max(self._sizes)
+        return self.padded(largest)
@@ -0,0 +1,440 @@
+# -*- coding: utf-8 -*-
+"""
+AIS.py - A Python interface for the Swisscom All-in Signing Service.
+
+:copyright: (c) 2016 by Camptocamp
+:license: AGPLv3, see README and LICENSE for more details
+
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+from datetime import timezone
+import io
+import os
+import re
+import threading
+
+from pyhanko.pdf_utils import generic
+from pyhanko.pdf_utils.reader import PdfFileReader
+
+from .pdf import DEFAULT_SIG_SIZE
+from .pdf import PDF
+from .prepared import BYTE_RANGE_RE
+from .prepared import PreparedPDF
+from .tracing import span
+
+
+from typing import Dict
+from typing import Hashable
+from typing import IO
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from .types import FileLike
+
+
+XREF_SUBSECTION_RE = re.compile(rb'(\d+) (\d+)\r?\n')
+XREF_ENTRY_RE = re.compile(rb'(\d{10}) (\d{5}) ([fn])[ \r\n]{2}')
+DATE_RE = re.compile(rb'\(D\\072(\d{14})([Z)])')
+TRAILER_RE = re.compile(
+    rb'/ID \[ <[0-9a-f]*> <[0-9a-f]*> \]\s*/Prev \d+\s*>>\s*$'
+)
+
+# an entry of an xref subsection, either a free entry which is copied
+# verbatim or the offset of an object relative to the start of the
+# update together with its generation
+XRefEntry = Tuple[Optional[int], bytes]
+
+
+def fingerprint(reader: PdfFileReader) -> Optional[Hashable]:
+    """Returns the structural features of a document which determine
+    how the signature field is added to it.
+
+    Documents with the same fingerprint likely share a template, but
+    :meth:`PDFTemplate.matches` needs to confirm that.
+
+    Returns `None` for documents which are not supported.
+    """
+    if reader.encrypted or reader.has_xref_stream:
+        return None
+
+    trailer = reader.trailer
+    try:
+        page_ref, _ = reader.find_page_for_modification(0)
+    except Exception:
+        return None
+
+    def reference(key: str) -> Optional[Tuple[int, int]]:
+        try:
+            value = trailer.raw_get(key)
+        except KeyError:
+            return None
+        if not isinstance(value, generic.IndirectObject):
+            return None
+        return value.idnum, value.generation
+
+    return (
+        reader.input_version,
+        int(trailer['/Size']),
+        reference('/Root'),
+        reference('/Info'),
+        (page_ref.idnum, page_ref.generation),
+    )
+
+
+class PDFTemplate:
+    """The incremental update which adds the signature placeholder to
+    documents rendered from the same template.
+
+    pyHanko is used once to sign a document of the template. The
+    update it appends is then reused for other documents of the
+    template, only the signing time, the offsets and the trailer
+    are adjusted. This is only done if the objects the update
+    replaces are identical in both documents.
+
+    Use :meth:`learn` to create a template.
+    """
+
+    def __init__(
+        self,
+        fingerprint: Hashable,
+        originals: Dict[Tuple[int, int], generic.PdfObject],
+        body: bytes,
+        xref: List[Tuple[int, List[XRefEntry]]],
+        trailer: bytes,
+        dates: List[Tuple[int, bool]],
+        byte_range: Tuple[int, int],
+        placeholder: Tuple[int, int]
+    ):
+        self.fingerprint = fingerprint
+        self.originals = originals
+        self.body = body
+        self.xref = xref
+        self.trailer = trailer
+        self.dates = dates
+        self.byte_range = byte_range
+        self.placeholder = placeholder
+
+    @classmethod
+    def learn(
+        cls,
+        data: bytes,
+        *,
+        sig_name: str = 'Signature',
+        sig_size: int = DEFAULT_SIG_SIZE
+    ) -> Optional['PDFTemplate']:
+        """Creates a template from a document using pyHanko.
+
+        Returns `None` if the update pyHanko creates for the document
+        can't be reused for other documents.
+        """
+        return cls._learn(data, sig_name=sig_name, sig_size=sig_size)[0]
+
+    @classmethod
+    def _learn(
+        cls,
+        data: bytes,
+        *,
+        sig_name: str,
+        sig_size: int
+    ) -> Tuple[Optional['PDFTemplate'], Optional[io.BytesIO]]:
+        # returns the document prepared by pyHanko as well, unless the
+        # document isn't supported at all
+        reader = PdfFileReader(io.BytesIO(data))
+        key = fingerprint(reader)
+        if key is None:
+            return None, None
+
+        pdf = PDF(
+            inout_stream=io.BytesIO(data),
+            sig_name=sig_name,
+            sig_size=sig_size
+        )
+        pdf.digest()
+        out_stream = pdf.out_stream
+        assert isinstance(out_stream, io.BytesIO)
+        with out_stream.getbuffer() as buffer:
+            update = bytes(buffer[len(data):])
+
+        prepared = pdf.prepared_digest
+        assert prepared is not None
+        placeholder = (
+            prepared.reserved_region_start - len(data),
+            prepared.reserved_region_end - len(data)
+        )
+        template = cls._from_update(key, reader, data, update, placeholder)
+        return template, out_stream
+
+    @classmethod
+    def _from_update(
+        cls,
+        key: Hashable,
+        reader: PdfFileReader,
+        data: bytes,
+        update: bytes,
+        placeholder: Tuple[int, int]
+    ) -> Optional['PDFTemplate']:
+        xref_start = update.rfind(b'\nxref\n') + 1
+        trailer_start = update.find(b'trailer', xref_start)
+        if xref_start == 0 or trailer_start < 0:
+            return None
+
+        xref = cls._parse_xref(update[xref_start + 5:trailer_start], data)
+        if xref is None:
+            return None
+
+        size = int(reader.trailer['/Size'])
+        originals = {}
+        for start, entries in xref:
+            for number, (offset, generation) in enumerate(entries, start):
+                if offset is None or number >= size:
+                    continue
+                ref = generic.Reference(number, int(generation), reader)
+                original = reader.get_object(ref)
+                if isinstance(original, generic.StreamObject):
+                    return None
+                originals[(number, int(generation))] = original
+
+        trailer = update[trailer_start:update.rfind(b'startxref')]
+        if not TRAILER_RE.search(trailer):
+            return None
+
+        body = update[:xref_start]
+        byte_range = BYTE_RANGE_RE.search(body)
+        if byte_range is None:
+            return None
+        byte_range_end = byte_range.end()
+        while body[byte_range_end:byte_range_end + 1] == b' ':
+            byte_range_end += 1
+
+        dates = [
+            (match.start(1), match.group(2) == b'Z')
+            for match in DATE_RE.finditer(body)
+        ]
+
+        return cls(
+            key,
+            originals,
+            body,
+            xref,
+            trailer,
+            dates,
+            (byte_range.start(), byte_range_end),
+            placeholder
+        )
+
+    @staticmethod
+    def _parse_xref(
+        table: bytes,
+        data: bytes
+    ) -> Optional[List[Tuple[int, List[XRefEntry]]]]:
+        subsections = []
+        position = 0
+        while position < len(table):
+            header = XREF_SUBSECTION_RE.match(table, position)
+            if header is None:
+                return None
+            start, count = (int(value) for value in header.groups())
+            position = header.end()
+
+            entries: List[XRefEntry] = []
+            for _ in range(count):
+                entry = XREF_ENTRY_RE.match(table, position)
+                if entry is None:
+                    return None
+                offset, generation, kind = entry.groups()
+                if kind == b'f':
+                    entries.append((None, entry.group(0)))
+                elif int(offset) < len(data):
+                    # the update refers to an object of the original
+                    return None
+                else:
+                    entries.append((int(offset) - len(data), generation))
+                position = entry.end()
+            subsections.append((start, entries))
+        return subsections
+
+    def matches(self, reader: PdfFileReader) -> bool:
+        """Whether the template can be applied to a document."""
+        if fingerprint(reader) != self.fingerprint:
+            return False
+
+        for (number, generation), original in self.originals.items():
+            try:
+                ref = generic.Reference(number, generation, reader)
+                if reader.get_object(ref) != original:
+                    return False
+            except Exception:
+                return False
+        return True
+
+    def apply(
+        self,
+        reader: PdfFileReader,
+        data: bytes,
+        out_stream: IO[bytes]
+    ) -> None:
+        """Writes the document together with the update to `out_stream`.
+
+        :meth:`matches` needs to be checked first.
+        """
+        base = len(data)
+        body = bytearray(self.body)
+
+        local = datetime.now().strftime('%Y%m%d%H%M%S').encode('ascii')
+        utc = datetime.now(tz=timezone.utc).strftime(
+            '%Y%m%d%H%M%S').encode('ascii')
+        for position, is_utc in self.dates:
+            body[position:position + 14] = utc if is_utc else local
+
+        xref = [b'xref\n']
+        for start, entries in self.xref:
+            xref.append(b'%d %d\n' % (start, len(entries)))
+            for offset, value in entries:
+                if offset is None:
+                    xref.append(value)
+                else:
+                    xref.append(b'%010d %s n \n' % (base + offset, value))
+
+        try:
+            id1 = reader.trailer['/ID'][0].original_bytes
+        except KeyError:
+            # like pyHanko we generate a primary ID if there is none
+            id1 = os.urandom(16)
+        id2 = os.urandom(16)
+        assert reader.last_startxref is not None
+        trailer = TRAILER_RE.sub(
+            b'/ID [ <%s> <%s> ]\n/Prev %d\n>>\n' % (
+                id1.hex().encode('ascii'),
+                id2.hex().encode('ascii'),
+                reader.last_startxref
+            ),
+            self.trailer
+        )
+        tail = b''.join(xref) + trailer + b'startxref\n%d\n%%%%EOF\n' % (
+            base + len(body))
+
+        sig_start, sig_end = self.placeholder
+        total = base + len(body) + len(tail)
+        byte_range = b'/ByteRange [0 %d %d %d]' % (
+            base + sig_start, base + sig_end, total - base - sig_end)
+        start, end = self.byte_range
+        body[start:end] = byte_range.ljust(end - start)
+
+        out_stream.seek(0)
+        out_stream.write(data)
+        out_stream.write(body)
+        out_stream.write(tail)
+        out_stream.truncate()
+
+
+class TemplateCache:
+    """Speeds up preparing documents rendered from a few templates.
+
+    Adding the signature field with pyHanko requires parsing large
+    parts of the document. For documents which only differ in the
+    contents of their pages, the update appended by pyHanko is the
+    same, except for the offsets and the signing time. This cache
+    remembers the update of the first document of each template and
+    reuses it for the following ones, which then only need their
+    cross-reference table and first page to be read.
+
+    Documents which share the structure of a known template, but
+    differ in the objects the update replaces, are prepared by pyHanko
+    without replacing the known template.
+
+    The returned documents are :class:`PreparedPDF` instances, so
+    the size of the signature can't be adapted after the fact.
+    Documents which don't match a known template are added as new
+    templates, documents whose structure isn't supported are returned
+    as regular :class:`PDF` instances::
+
+        templates = TemplateCache()
+        ais.sign_batch([templates.pdf(path) for path in paths])
+
+    :param max_templates: The number of templates to remember, the
+    least recently used ones are discarded first.
+    """
+
+    def __init__(self, max_templates: int = 16):
+        self.max_templates = max_templates
+        self._templates: 'OrderedDict[Hashable, PDFTemplate]'
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    def _get(self, key: Hashable) -> Optional[PDFTemplate]:
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None:
+                self._templates.move_to_end(key)
+            return template
+
+    def _add(self, key: Hashable, template: PDFTemplate) -> None:
+        with self._lock:
+            # a known template is kept, even if another layout with the
+            # same fingerprint shows up. Replacing it would make both
+            # layouts miss when they alternate.
+            self._templates.setdefault(key, template)
+            self._templates.move_to_end(key)
+            while len(self._templates) > self.max_templates:
+                self._templates.popitem(last=False)
+
+    def pdf(
+        self,
+        input_file: 'FileLike',
+        *,
+        out_stream: Optional[IO[bytes]] = None,
+        sig_name: str = 'Signature',
+        sig_size: int = DEFAULT_SIG_SIZE
+    ) -> PDF:
+        """Returns a PDF ready to be signed.
+
+        The parameters are the same as for :class:`PDF`.
+        """
+        if isinstance(input_file, str):
+            with open(input_file, 'rb') as fp:
+                data = fp.read()
+        else:
+            data = input_file.read()
+
+        with span('ais.pdf.template', {'ais.sig_name': sig_name}):
+            reader = PdfFileReader(io.BytesIO(data))
+            key = (sig_name, sig_size, fingerprint(reader))
+            template = self._get(key) if key[2] is not None else None
+            prepared: Optional[io.BytesIO]
+            if template is not None and template.matches(reader):
+                prepared = io.BytesIO()
+                template.apply(reader, data, prepared)
+            else:
+                # pyHanko prepares the document while learning the
+                # template, that output is used as is
+                template, prepared = PDFTemplate._learn(
+                    data, sig_name=sig_name, sig_size=sig_size)
+                if template is not None:
+                    self._add(key, template)
+
+            if prepared is None:
+                if out_stream is None:
+                    return PDF(inout_stream=io.BytesIO(data),
+                               sig_name=sig_name, sig_size=sig_size)
+                return PDF(
+                    io.BytesIO(data),
+                    out_stream=out_stream,
+                    sig_name=sig_name,
+                    sig_size=sig_size
+                )
+
+        prepared.seek(0)
+        if out_stream is None:
+            return PreparedPDF(inout_stream=prepared, sig_name=sig_name)
+        return PreparedPDF(
+            prepared,
+            out_stream=out_stream,
+            sig_name=sig_name
+        )
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+AIS.py - A Python interface for the Swisscom All-in Signing Service.
+
+:copyright: (c) 2016 by Camptocamp
+:license: AGPLv3, see README and LICENSE for more details
+
+"""
+
+from contextlib import nullcontext
+
+
+from typing import Any
+from typing import ContextManager
+from typing import Dict
+from typing import Optional
+from typing import Protocol
+
+
+class Tracer(Protocol):
+    """The part of the OpenTelemetry ``Tracer`` interface we use."""
+
+    def start_as_current_span(
+        self,
+        name: str,
+        attributes: Optional[Dict[str, Any]] = ...
+    ) -> ContextManager[Any]: ...
+
+
+_tracer: Optional[Tracer] = None
+
+
+def set_tracer(tracer: Optional[Tracer]) -> None:
+    """Configures the tracer used to create spans for each phase of
+    signing documents, pass `None` to disable tracing again.
+
+    Any OpenTelemetry tracer may be used::
+
+        >>> from opentelemetry import trace
+        >>> set_tracer(trace.get_tracer('AIS'))
+
+    The following spans are created:
+
+    - ``ais.pdf.prepare``: Preparing the signature field of a PDF
+    - ``ais.pdf.template``: Preparing a PDF using a :class:`TemplateCache`
+    - ``ais.sign``: A request to AIS, including all the phases below
+    - ``ais.digest``: Preparing a PDF and computing its digest
+    - ``ais.request.build``: Building the request payload
+    - ``ais.request.http``: The HTTP round-trip
+    - ``ais.response.parse``: Parsing the response
+    - ``ais.embed``: Embedding a signature in a PDF
+
+    The spans are tagged with ``ais.request_id``, ``ais.batch_size``
+    and ``ais.document_index`` where applicable.
+    """
+    global _tracer
+    _tracer = tracer
+
+
+def get_tracer() -> Optional[Tracer]:
+    """Returns the configured tracer, if any."""
+    return _tracer
+
+
+def span(
+    name: str,
+    attributes: Optional[Dict[str, Any]] = None
+) -> ContextManager[Any]:
+    """Starts a span if a tracer is configured, otherwise does nothing."""
+    if _tracer is None:
+        return nullcontext()
+    return _tracer.start_as_current_span(name, attributes=attributes)
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+AIS.py - A Python interface for the Swisscom All-in Signing Service.
+
+:copyright: (c) 2016 by Camptocamp
+:license: AGPLv3, see README and LICENSE for more details
+
+"""
+
+import threading
+
+
+from typing import Dict
+from typing import Optional
+
+
+class BatchStats:
+    """Smoothed observations for one batch size."""
+
+    def __init__(self, latency: float, response_size: int):
+        self.latency = latency
+        self.response_size = float(response_size)
+        self.count = 1
+        self.last_seen = 0
+        self.failed = False
+
+    def update(
+        self,
+        latency: float,
+        response_size: int,
+        smoothing: float
+    ) -> None:
+        self.latency += smoothing * (latency - self.latency)
+        self.response_size += smoothing * (
+            response_size - self.response_size)
+        self.count += 1
+
+    def throughput(self, batch_size: int) -> float:
+        """Documents per second."""
+        return batch_size / max(self.latency, 1e-6)
+
+
+class BatchTuner:
+    """Chooses the size of the batches sent to AIS.
+
+    The latency and response size of every request is recorded per
+    batch size. The tuner settles on the batch size with the best
+    throughput in documents per second among the batch sizes that
+    stay within the bounds. Every few batches a neighbouring size
+    (half or double the current size) is tried, so the tuner keeps
+    adapting when the conditions of the service change.
+
+    Pass an instance to :class:`AIS` to split large batches into
+    chunks of the chosen size.
+
+    :param initial: The batch size to start with.
+
+    :param min_size: The smallest batch size to use.
+
+    :param max_size: The largest batch size to use.
+
+    :param latency_bound: Maximum acceptable latency of a request in
+    seconds.
+
+    :param max_response_size: Optional maximum acceptable size of a
+    response in bytes.
+
+    :param smoothing: Weight of a new observation in the moving
+    average, between 0 and 1.
+
+    :param explore_every: Try a neighbouring batch size every this
+    many batches.
+
+    :param memory: Observations for a batch size are discarded if it
+    hasn't been used for this many batches.
+    """
+
+    def __init__(
+        self,
+        initial: int = 50,
+        min_size: int = 1,
+        max_size: int = 1000,
+        latency_bound: float = 10.0,
+        max_response_size: Optional[int] = None,
+        smoothing: float = 0.3,
+        explore_every: int = 10,
+        memory: int = 100
+    ):
+        assert min_size <= initial <= max_size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.latency_bound = latency_bound
+        self.max_response_size = max_response_size
+        self.smoothing = smoothing
+        self.explore_every = explore_every
+        self.memory = memory
+
+        self.current = initial
+        """The batch size currently considered to be the best."""
+
+        self.stats: Dict[int, BatchStats] = {}
+        """The observations per batch size."""
+
+        self._batches = 0
+        self._explore_up = True
+        self._lock = threading.Lock()
+
+    def batch_size(self) -> int:
+        """Returns the size to use for the next batch."""
+        with self._lock:
+            self._batches += 1
+            if not self.explore_every or self._batches % self.explore_every:
+                return self.current
+
+            # alternate between exploring larger and smaller batches
+            self._explore_up = not self._explore_up
+            if self._explore_up:
+                return min(self.max_size, self.current * 2)
+            return max(self.min_size, self.current // 2)
+
+    def record(
+        self,
+        batch_size: int,
+        latency: float,
+        response_size: int,
+        failed: bool = False
+    ) -> None:
+        """Records the outcome of a request signing `batch_size`
+        documents.
+
+        :param failed: Whether the request failed, for example because
+        it timed out. The batch size is then considered out of bounds
+        until a request of that size succeeds.
+        """
+        with self._lock:
+            stats = self.stats.get(batch_size)
+            if stats is None or (not failed and stats.count == 0):
+                stats = self.stats[batch_size] = BatchStats(
+                    latency, response_size)
+                if failed:
+                    # the latency and response size of a failed request
+                    # say nothing about the batch size
+                    stats.count = 0
+            elif not failed:
+                stats.update(latency, response_size, self.smoothing)
+            stats.failed = failed
+            stats.last_seen = self._batches
+
+            # forget about sizes we haven't tried in a long time,
+            # the conditions have likely changed since
+            for size, other in list(self.stats.items()):
+                if self._batches - other.last_seen > self.memory:
+                    del self.stats[size]
+
+            self.current = self._best()
+
+    def _within_bounds(self, stats: BatchStats) -> bool:
+        if stats.failed:
+            return False
+        if stats.latency > self.latency_bound:
+            return False
+        if self.max_response_size is None:
+            return True
+        return stats.response_size <= self.max_response_size
+
+    def _best(self) -> int:
+        candidates = [
+            (stats.throughput(size), size)
+            for size, stats in self.stats.items()
+            if self._within_bounds(stats)
+        ]
+        if candidates:
+            return max(candidates)[1]
+
+        # even the smallest batch we tried was too slow, too large or
+        # failed
+        return max(self.min_size, min(self.stats) // 2)
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+AIS.py - A Python interface for the Swisscom All-in Signing Service.
+
+:copyright: (c) 2016 by Camptocamp
+:license: AGPLv3, see README and LICENSE for more details
+
+"""
+
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
+from dataclasses import dataclass
+import io
+import os
+
+from pyhanko.keys import load_certs_from_pemder_data
+from pyhanko.pdf_utils.reader import PdfFileReader
+from pyhanko.sign.validation import validate_pdf_signature
+from pyhanko.sign.validation.status import PdfSignatureStatus
+from pyhanko_certvalidator import ValidationContext
+
+from .pdf import PDF
+
+
+from typing import Any
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Set
+from typing import Union
+
+
+Document = Union[str, bytes, PDF]
+Certificates = Sequence[Union[str, bytes]]
+
+
+@dataclass(frozen=True)
+class VerificationResult:
+    """The outcome of verifying the signatures of one document."""
+
+    index: int
+    """Position of the document in the verified documents."""
+
+    intact: bool
+    """Whether the signed parts of the document are unchanged."""
+
+    valid: bool
+    """Whether the signatures are cryptographically valid."""
+
+    trusted: bool
+    """Whether the signers could be traced back to a trust root."""
+
+    docmdp_ok: bool
+    """Whether the changes made after signing are permitted by the
+    signatures."""
+
+    coverage: str
+    """The part of the document covered by the signatures, the name of
+    the weakest pyHanko ``SignatureCoverageLevel``."""
+
+    bottom_line: bool
+    """pyHanko's overall judgement of the signatures, taking into
+    account all of the above."""
+
+    summary: str
+    """Human readable summary of the validation statuses."""
+
+    error: Optional[str] = None
+    """Set if the document could not be verified at all."""
+
+    @property
+    def ok(self) -> bool:
+        return self.bottom_line
+
+
+def _failed(index: int, error: str) -> VerificationResult:
+    return VerificationResult(
+        index=index,
+        intact=False,
+        valid=False,
+        trusted=False,
+        docmdp_ok=False,
+        coverage='',
+        bottom_line=False,
+        summary='',
+        error=error
+    )
+
+
+def _coverage(statuses: Sequence[PdfSignatureStatus]) -> str:
+    levels = [status.coverage for status in statuses]
+    if any(level is None for level in levels):
+        return ''
+    return min(level for level in levels if level is not None).name
+
+
+def _read(value: Union[str, bytes]) -> bytes:
+    if isinstance(value, str):
+        with open(value, 'rb') as fp:
+            return fp.read()
+    return value
+
+
+def validation_context(
+    trust_roots: Certificates = (),
+    other_certs: Certificates = (),
+    crls: Sequence[bytes] = (),
+    ocsps: Sequence[bytes] = (),
+    allow_fetching: bool = False
+) -> ValidationContext:
+    """Creates a validation context.
+
+    Certificates may be passed as filenames or as PEM or DER encoded
+    data, CRLs and OCSP responses as DER encoded data.
+
+    The context caches the certificates and revocation information
+    it encounters, so it should be reused for many documents.
+    """
+    def load(certs: Certificates) -> List[Any]:
+        return [
+            cert
+            for value in certs
+            for cert in load_certs_from_pemder_data(_read(value))
+        ]
+
+    return ValidationContext(
+        trust_roots=load(trust_roots),
+        other_certs=load(other_certs),
+        crls=list(crls),
+        ocsps=list(ocsps),
+        allow_fetching=allow_fetching
+    )
+
+
+def verify_pdf(
+    document: Document,
+    context: Optional[ValidationContext] = None,
+    index: int = 0
+) -> VerificationResult:
+    """Verifies all the signatures embedded in a document.
+
+    :param document: A filename, the contents of a signed PDF
+    or a signed :class:`PDF`.
+
+    :param context: The validation context used to establish trust,
+    see :func:`validation_context`.
+
+    :param index: Passed through to the result.
+    """
+    try:
+        if isinstance(document, PDF):
+            data = document.signed_bytes()
+        else:
+            data = _read(document)
+
+        reader = PdfFileReader(io.BytesIO(data))
+        signatures = reader.embedded_signatures
+        if not signatures:
+            return _failed(index, 'No signatures found')
+
+        statuses = [
+            validate_pdf_signature(
+                signature,
+                signer_validation_context=context
+            )
+            for signature in signatures
+        ]
+    except Exception as exception:
+        return _failed(index, repr(exception))
+
+    return VerificationResult(
+        index=index,
+        intact=all(status.intact for status in statuses),
+        valid=all(status.valid for status in statuses),
+        trusted=all(status.trusted for status in statuses),
+        docmdp_ok=all(
+            status.docmdp_ok or status.modification_level is None
+            for status in statuses
+        ),
+        coverage=_coverage(statuses),
+        bottom_line=all(status.bottom_line for status in statuses),
+        summary='; '.join(status.summary() for status in statuses)
+    )
+
+
+# the validation context of a worker process
+_context: Optional[ValidationContext] = None
+
+
+def _init_worker(*args: Any) -> None:
+    global _context
+    _context = validation_context(*args)
+
+
+def _verify_in_worker(index: int, document: Union[str, bytes]) -> Any:
+    return verify_pdf(document, _context, index)
+
+
+def verify_pdfs(
+    documents: Iterable[Document],
+    *,
+    trust_roots: Certificates = (),
+    other_certs: Certificates = (),
+    crls: Sequence[bytes] = (),
+    ocsps: Sequence[bytes] = (),
+    allow_fetching: bool = False,
+    max_workers: Optional[int] = None,
+    max_pending: Optional[int] = None
+) -> Iterator[VerificationResult]:
+    """Verifies the signatures of many documents in a process pool.
+
+    Each worker process creates one validation context, which is
+    reused for all the documents it verifies. The results are
+    yielded in the order the documents finish, use
+    :attr:`VerificationResult.index` to match them to the documents.
+
+    Documents are passed to the workers by filename if possible,
+    otherwise their contents are sent to the worker.
+
+    :param documents: Filenames, contents of signed PDFs or signed
+    :class:`PDF` instances.
+
+    :param max_workers: The number of worker processes, by default
+    the number of CPUs.
+
+    :param max_pending: The number of documents handed to the workers
+    at once, by default four per worker. This bounds the memory used
+    for large numbers of documents.
+
+    The remaining parameters are passed to :func:`validation_context`.
+    """
+    initargs = (
+        [_read(cert) for cert in trust_roots],
+        [_read(cert) for cert in other_certs],
+        list(crls),
+        list(ocsps),
+        allow_fetching
+    )
+
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = max_pending or 4 * max_workers
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_worker,
+        initargs=initargs
+    ) as executor:
+        pending: Set[Any] = set()
+        for index, document in enumerate(documents):
+            if isinstance(document, PDF):
+                document = document.signed_bytes()
+            pending.add(executor.submit(_verify_in_worker, index, document))
+
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
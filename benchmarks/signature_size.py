@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+AIS.py - A Python interface for the Swisscom All-in Signing Service.
+
+:copyright: (c) 2016 by Camptocamp
+:license: AGPLv3, see README and LICENSE for more details
+
+Reports the number of bytes each signature adds to a document.
+
+The documents are signed locally with a self-signed certificate, so
+no AIS account is needed. Usage::
+
+    PYTHONPATH=. python benchmarks/signature_size.py [document.pdf ...]
+
+The fixtures of the test suite are used by default.
+"""
+
+import asyncio
+import base64
+from glob import glob
+import io
+from os.path import basename, dirname, join
+import sys
+
+from pyhanko.sign import signers
+
+from AIS import PDF
+from AIS import SignatureSizer
+
+
+fixtures = join(dirname(__file__), '..', 'tests', 'fixtures')
+
+
+def signed_size(data, signer, **kwargs):
+    pdf = PDF(inout_stream=io.BytesIO(data), **kwargs)
+    digest = base64.b64decode(pdf.digest())
+    signature = asyncio.run(signer.async_sign(digest, 'sha256')).dump()
+    pdf.write_signature(signature)
+    return len(pdf.signed_bytes()), len(signature)
+
+
+def main(paths):
+    signer = signers.SimpleSigner.load(
+        join(fixtures, 'test.key'), join(fixtures, 'test.crt'))
+
+    # the size a SignatureSizer settles on for these signatures
+    sizer = SignatureSizer()
+    with open(paths[0], 'rb') as fp:
+        _, signature_size = signed_size(fp.read(), signer)
+    sizer.observe(signature_size * 2)
+    adaptive = sizer.reserve()
+
+    modes = (
+        ('default', {}),
+        ('compact', {'compact': True}),
+        ('adaptive', {'sig_size': adaptive}),
+        ('compact+adaptive', {'sig_size': adaptive, 'compact': True}),
+    )
+
+    row = '{:<20} {:<18} {:>10} {:>10}'
+    print(row.format('document', 'mode', 'added', 'overhead'))
+    for path in paths:
+        with open(path, 'rb') as fp:
+            data = fp.read()
+        for mode, kwargs in modes:
+            size, signature_size = signed_size(data, signer, **kwargs)
+            added = size - len(data)
+            # everything but the hex encoded signature itself
+            overhead = added - signature_size * 2
+            print(row.format(basename(path), mode, added, overhead))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or sorted(glob(join(fixtures, '*.pdf'))))
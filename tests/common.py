@@ -6,11 +6,14 @@ AIS.py - A Python interface for the Swisscom All-in Signing Service.
 :license: AGPLv3, see README and LICENSE for more details
 
 """
+import asyncio
+import base64
 import json
 from os.path import dirname, join
 import unittest
 
 from pyhanko.pdf_utils.reader import PdfFileReader
+from pyhanko.sign import signers
 from pyhanko.sign.validation import validate_pdf_signature
 
 from vcr import VCR
@@ -91,5 +94,14 @@ def validate_signature(pdf):
     return validate_pdf_signature(signature)
 
 
+def sign_locally(pdf):
+    """Signs the pdf with the test certificate instead of AIS."""
+    signer = signers.SimpleSigner.load(
+        fixture_path('test.key'), fixture_path('test.crt'))
+    digest = base64.b64decode(pdf.digest())
+    signature = asyncio.run(signer.async_sign(digest, 'sha256'))
+    pdf.write_signature(signature.dump())
+
+
 class BaseCase(unittest.TestCase):
     pass
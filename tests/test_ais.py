@@ -10,7 +10,8 @@ from os import environ
 
 from common import my_vcr, fixture_path, BaseCase
 
-from AIS import AIS, AuthenticationFailed, PDF
+from AIS import AIS, AuthenticationFailed, MultiSignaturePDF, PDF, Profiler
+from AIS import UnknownAISError
 
 
 class TestAIS(BaseCase):
@@ -20,6 +21,13 @@ class TestAIS(BaseCase):
                              cert_file='alice.crt', cert_key='alice.key')
         self.assertEqual('alice', alice_instance.customer)
         self.assertEqual('alice_secret', alice_instance.key_static)
+        self.assertIsNone(alice_instance.url)
+
+    def test_constructor_with_url(self):
+        instance = AIS(customer='alice', key_static='alice_secret',
+                       cert_file='alice.crt', cert_key='alice.key',
+                       url='https://example.org/sign')
+        self.assertEqual('https://example.org/sign', instance.url)
 
     def test_sign_single_unprepared_pdf(self):
         self.assertIsNone(self.instance.last_request_id)
@@ -29,6 +37,8 @@ class TestAIS(BaseCase):
             self.instance.sign_one_pdf(pdf)
 
         self.assertIsNotNone(self.instance.last_request_id)
+        self.assertTrue(self.instance.health.healthy)
+        self.assertEqual(self.instance.health.requests, 1)
 
         # TODO check the signature
 
@@ -44,6 +54,82 @@ class TestAIS(BaseCase):
 
         # TODO check the signature
 
+    def test_sign_batch_memory_budget(self):
+        instance = AIS(self.customer, self.key_static,
+                       self.cert_file, self.cert_key,
+                       memory_budget=0)
+
+        pdfs = [PDF(fixture_path(filename))
+                for filename in ["one.pdf", "two.pdf", "three.pdf"]]
+        with my_vcr.use_cassette('sign_batch'):
+            instance.sign_batch(pdfs)
+
+        for pdf in pdfs:
+            self.assertEqual(pdf.buffered_size, 0)
+            self.assertTrue(pdf.signed_bytes().startswith(b'%PDF'))
+
+    def test_sign_batch_profiler(self):
+        profiler = Profiler()
+        instance = AIS(self.customer, self.key_static,
+                       self.cert_file, self.cert_key,
+                       profiler=profiler)
+
+        pdfs = [PDF(fixture_path(filename))
+                for filename in ["one.pdf", "two.pdf", "three.pdf"]]
+        with my_vcr.use_cassette('sign_batch'):
+            instance.sign_batch(pdfs)
+        profiler.close()
+
+        documents = {}
+        for (phase, _), stats in profiler.stats.items():
+            documents[phase] = documents.get(phase, 0) + stats.documents
+        self.assertEqual(documents, {'ais.digest': 3, 'ais.embed': 3})
+        self.assertEqual(set(profiler.profiles), {'ais.digest', 'ais.embed'})
+
+    def test_sign_fields(self):
+        documents = [
+            MultiSignaturePDF(fixture_path(filename),
+                              sig_names=['First', 'Second'])
+            for filename in ["one.pdf", "two.pdf", "three.pdf"]
+        ]
+        with my_vcr.use_cassette('sign_batch',
+                                 allow_playback_repeats=True) as cassette:
+            self.instance.sign_fields(documents)
+
+        # one request per field for all the documents
+        self.assertEqual(cassette.play_count, 2)
+        for document in documents:
+            self.assertEqual(document.signed, 2)
+            self.assertIsNone(document.pending)
+            self.assertIn(b'/T (First)', document.signed_bytes())
+            self.assertIn(b'/T (Second)', document.signed_bytes())
+
+    def test_sign_digests(self):
+        pdf = PDF(fixture_path('one.pdf'))
+        with my_vcr.use_cassette('sign_unprepared_pdf'):
+            signatures = self.instance.sign_digests([pdf.digest()])
+        self.assertEqual(len(signatures), 1)
+        pdf.write_signature(signatures[0])
+
+        pdfs = [PDF(fixture_path(filename))
+                for filename in ["one.pdf", "two.pdf", "three.pdf"]]
+        with my_vcr.use_cassette('sign_batch'):
+            signatures = self.instance.sign_digests(
+                [pdf.digest() for pdf in pdfs])
+        self.assertEqual(len(signatures), 3)
+        self.assertTrue(all(signatures))
+
+        self.assertEqual(self.instance.sign_digests([]), [])
+
+    def test_sign_digests_missing_signature(self):
+        pdfs = [PDF(fixture_path(filename))
+                for filename in ["one.pdf", "two.pdf", "three.pdf"]]
+        digests = [pdf.digest() for pdf in pdfs]
+        # the recorded response only contains three signatures
+        with my_vcr.use_cassette('sign_batch'):
+            with self.assertRaises(UnknownAISError):
+                self.instance.sign_digests(digests + digests[:1])
+
     def test_sign_single_unprepared_pdf_as_batch(self):
         self.assertIsNone(self.instance.last_request_id)
 
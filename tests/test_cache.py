@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+AIS.py - A Python interface for the Swisscom All-in Signing Service.
+
+:copyright: (c) 2016 by Camptocamp
+:license: AGPLv3, see README and LICENSE for more details
+
+"""
+import os
+from tempfile import TemporaryDirectory
+import time
+from unittest import mock
+
+from common import my_vcr, fixture_path, BaseCase
+
+from AIS import AIS, DirectoryCache, MemoryCache, PDF
+from AIS.cache import cache_key
+
+
+class TestCacheKey(BaseCase):
+
+    def test_same_contents_same_key(self):
+        with open(fixture_path('one.pdf'), mode='rb') as fp:
+            first = PDF(fp)
+            second = PDF(fixture_path('one.pdf'))
+
+            self.assertEqual(
+                cache_key(first, profile='p', identity='a:b'),
+                cache_key(second, profile='p', identity='a:b')
+            )
+
+    def test_parameters_change_key(self):
+        pdf = PDF(fixture_path('one.pdf'))
+        key = cache_key(pdf, profile='p', identity='a:b')
+
+        self.assertNotEqual(key, cache_key(pdf, profile='p', identity='a:c'))
+        self.assertNotEqual(key, cache_key(pdf, profile='q', identity='a:b'))
+        self.assertNotEqual(key, cache_key(
+            PDF(fixture_path('one.pdf'), sig_name='Other'),
+            profile='p',
+            identity='a:b'
+        ))
+        self.assertNotEqual(key, cache_key(
+            PDF(fixture_path('two.pdf')),
+            profile='p',
+            identity='a:b'
+        ))
+
+    def test_key_unchanged_after_in_place_signing(self):
+        pdf = PDF(fixture_path('one.pdf'))
+        pdf.digest()
+        pdf.write_signature(b'0')
+        self.assertEqual(
+            cache_key(pdf, profile='p', identity='a:b'),
+            cache_key(PDF(fixture_path('one.pdf')), profile='p',
+                      identity='a:b')
+        )
+
+
+class TestMemoryCache(BaseCase):
+
+    def test_max_entries(self):
+        cache = MemoryCache(max_entries=2)
+        cache.set('a', b'1')
+        cache.set('b', b'2')
+        self.assertEqual(cache.get('a'), b'1')
+        cache.set('c', b'3')
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), b'1')
+        self.assertEqual(cache.get('c'), b'3')
+
+    def test_max_bytes(self):
+        cache = MemoryCache(max_entries=None, max_bytes=4)
+        cache.set('a', b'12')
+        cache.set('b', b'34')
+        cache.set('c', b'5')
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), b'34')
+        self.assertEqual(cache.get('c'), b'5')
+
+    def test_max_age(self):
+        cache = MemoryCache(max_age=0)
+        cache.set('a', b'1')
+        time.sleep(0.01)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+
+class TestDirectoryCache(BaseCase):
+
+    def test_get_set(self):
+        with TemporaryDirectory() as path:
+            cache = DirectoryCache(path)
+            self.assertIsNone(cache.get('a'))
+            cache.set('a', b'1')
+            self.assertEqual(cache.get('a'), b'1')
+            self.assertEqual(DirectoryCache(path).get('a'), b'1')
+
+    def test_max_bytes(self):
+        with TemporaryDirectory() as path:
+            cache = DirectoryCache(path, max_bytes=4)
+            cache.set('a', b'12')
+            os.utime(os.path.join(path, 'a.pdf'), (1, 1))
+            cache.set('b', b'34')
+            cache.set('c', b'5')
+
+            self.assertIsNone(cache.get('a'))
+            self.assertEqual(cache.get('b'), b'34')
+            self.assertEqual(cache.get('c'), b'5')
+
+    def test_scans_only_when_needed(self):
+        with TemporaryDirectory() as path:
+            cache = DirectoryCache(path, max_bytes=100, scan_every=50)
+            scandir = os.scandir
+            with mock.patch('os.scandir', side_effect=scandir) as scan:
+                # the first insert establishes the total size
+                for index in range(10):
+                    cache.set(str(index), b'12')
+                    os.utime(os.path.join(path, f'{index}.pdf'),
+                             (index, index))
+                self.assertEqual(scan.call_count, 1)
+
+                # exceeding the limit evicts down to the low watermark
+                cache.set('large', b'1' * 85)
+                self.assertEqual(scan.call_count, 2)
+                self.assertEqual(cache._size, 89)
+                self.assertIsNone(cache.get('7'))
+                self.assertEqual(cache.get('8'), b'12')
+
+                cache.set('small', b'1')
+                self.assertEqual(scan.call_count, 2)
+
+                # replacing an entry only counts the difference
+                cache.set('small', b'12')
+                self.assertEqual(cache._size, 91)
+
+                for index in range(48):
+                    cache.set('small', b'12')
+                self.assertEqual(scan.call_count, 3)
+
+    def test_max_age(self):
+        with TemporaryDirectory() as path:
+            cache = DirectoryCache(path, max_age=60)
+            cache.set('a', b'1')
+            os.utime(os.path.join(path, 'a.pdf'), (1, 1))
+            self.assertIsNone(cache.get('a'))
+            self.assertFalse(os.path.exists(os.path.join(path, 'a.pdf')))
+
+
+class TestSigningWithCache(BaseCase):
+
+    def setUp(self):
+        self.cache = MemoryCache()
+        self.instance = AIS('bonnie', 'the_secret',
+                            fixture_path('test.crt'),
+                            fixture_path('test.key'),
+                            cache=self.cache)
+
+    def test_sign_one_pdf_cached(self):
+        pdf = PDF(fixture_path('one.pdf'))
+        with my_vcr.use_cassette('sign_unprepared_pdf'):
+            self.instance.sign_one_pdf(pdf)
+
+        request_id = self.instance.last_request_id
+        self.assertIsNotNone(request_id)
+        self.assertEqual(len(self.cache), 1)
+
+        again = PDF(fixture_path('one.pdf'))
+        self.instance.sign_one_pdf(again)
+        self.assertEqual(self.instance.last_request_id, request_id)
+        self.assertEqual(again.out_stream.getvalue(),
+                         pdf.out_stream.getvalue())
+
+    def test_sign_batch_cached(self):
+        pdfs = [PDF(fixture_path(filename))
+                for filename in ["one.pdf", "two.pdf", "three.pdf"]]
+        with my_vcr.use_cassette('sign_batch'):
+            self.instance.sign_batch(pdfs)
+
+        request_id = self.instance.last_request_id
+        self.assertEqual(len(self.cache), 3)
+
+        again = [PDF(fixture_path(filename))
+                 for filename in ["one.pdf", "two.pdf", "three.pdf"]]
+        self.instance.sign_batch(again)
+        self.assertEqual(self.instance.last_request_id, request_id)
+        for pdf, cached in zip(pdfs, again):
+            self.assertEqual(cached.out_stream.getvalue(),
+                             pdf.out_stream.getvalue())
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+AIS.py - A Python interface for the Swisscom All-in Signing Service.
+
+:copyright: (c) 2016 by Camptocamp
+:license: AGPLv3, see README and LICENSE for more details
+
+"""
+import threading
+import time
+
+import requests
+
+from common import fixture_path, BaseCase
+
+from AIS import AIS, AuthenticationFailed, UnknownAISError
+from AIS.connections import ConnectionHealth, KeepAlive
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.body = body
+        self.consumed = False
+        self.closed = False
+
+    @property
+    def content(self):
+        self.consumed = True
+        return b'<html>Bad Gateway</html>'
+
+    def json(self):
+        if self.body is None:
+            raise ValueError('not JSON')
+        return self.body
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    """Answers HEAD requests, waiting until `concurrency` of them are
+    in progress, like separate connections would."""
+
+    def __init__(self, status_code=405, error=None, concurrency=1,
+                 body=None):
+        self.status_code = status_code
+        self.error = error
+        self.body = body
+        self.barrier = threading.Barrier(concurrency, timeout=5)
+        self.responses = []
+        self.lock = threading.Lock()
+
+    def head(self, url, **kwargs):
+        self.barrier.wait()
+        if self.error is not None:
+            raise self.error
+        response = FakeResponse(self.status_code)
+        with self.lock:
+            self.responses.append(response)
+        return response
+
+    def post(self, url, **kwargs):
+        response = FakeResponse(self.status_code, self.body)
+        self.responses.append(response)
+        return response
+
+    def close(self):
+        pass
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def error_body(minor):
+    return {'SignResponse': {'Result': {
+        'ResultMajor': 'urn:oasis:names:tc:dss:1.0:resultmajor:RequesterError',
+        'ResultMinor': f'http://ais.swisscom.ch/1.0/resultminor/{minor}',
+        'ResultMessage': {'$': minor, '@xml:lang': 'en'}
+    }}}
+
+
+def client(**kwargs):
+    return AIS('alice', 'alice_secret',
+               fixture_path('test.crt'), fixture_path('test.key'), **kwargs)
+
+
+class TestConnectionHealth(BaseCase):
+
+    def test_initially_unknown(self):
+        health = ConnectionHealth()
+        self.assertFalse(health.healthy)
+        self.assertIsNone(health.idle_time())
+
+    def test_record(self):
+        clock = FakeClock()
+        health = ConnectionHealth(clock)
+        health.record(latency=0.5)
+        self.assertTrue(health.healthy)
+        self.assertEqual(health.latency, 0.5)
+
+        error = requests.ConnectionError()
+        health.record(error)
+        health.record(error)
+        self.assertFalse(health.healthy)
+        self.assertEqual(health.failures, 2)
+        self.assertIs(health.last_error, error)
+
+        clock.now = 10.0
+        self.assertEqual(health.idle_time(), 10.0)
+        health.record()
+        self.assertTrue(health.healthy)
+        self.assertEqual(health.requests, 4)
+        self.assertEqual(health.errors, 2)
+        self.assertEqual(health.idle_time(), 0.0)
+
+
+class TestWarmUp(BaseCase):
+
+    def test_probe(self):
+        instance = client()
+        instance.session = FakeSession()
+        self.assertTrue(instance.probe())
+        self.assertTrue(instance.health.healthy)
+        self.assertIsNotNone(instance.health.latency)
+
+    def test_probe_connection_error(self):
+        instance = client()
+        instance.session = FakeSession(error=requests.ConnectionError())
+        self.assertFalse(instance.probe())
+        self.assertFalse(instance.health.healthy)
+        self.assertEqual(instance.health.errors, 1)
+
+    def test_probe_rejected(self):
+        instance = client()
+        instance.session = FakeSession(status_code=403)
+        self.assertFalse(instance.probe())
+        self.assertIsInstance(
+            instance.health.last_error, requests.HTTPError)
+        # the connection is released rather than kept by the response
+        self.assertTrue(instance.session.responses[0].closed)
+
+    def test_post_error_page(self):
+        instance = client()
+        instance.session = FakeSession(status_code=502)
+        with self.assertRaises(ValueError):
+            instance.post('{}')
+        self.assertFalse(instance.health.healthy)
+        self.assertEqual(instance.health.errors, 1)
+
+    def test_post_request_error(self):
+        # the request was rejected, but the connection works
+        instance = client()
+        instance.session = FakeSession(
+            status_code=200, body=error_body('InvalidRequest'))
+        with self.assertRaises(UnknownAISError):
+            instance.post('{}')
+        self.assertTrue(instance.health.healthy)
+        self.assertEqual(instance.health.errors, 0)
+
+    def test_post_authentication_failed(self):
+        instance = client()
+        instance.session = FakeSession(
+            status_code=200, body=error_body('AuthenticationFailed'))
+        with self.assertRaises(AuthenticationFailed):
+            instance.post('{}')
+        self.assertFalse(instance.health.healthy)
+        self.assertEqual(instance.health.errors, 1)
+
+    def test_post_server_error(self):
+        instance = client()
+        instance.session = FakeSession(
+            status_code=500, body=error_body('GeneralError'))
+        with self.assertRaises(UnknownAISError):
+            instance.post('{}')
+        self.assertFalse(instance.health.healthy)
+        self.assertEqual(instance.health.errors, 1)
+
+    def test_warm_up(self):
+        instance = client(max_connections=4)
+        # the probes only complete if they run concurrently
+        instance.session = FakeSession(concurrency=4)
+        self.assertEqual(instance.warm_up(), 4)
+        self.assertEqual(len(instance.session.responses), 4)
+        self.assertTrue(all(
+            response.consumed for response in instance.session.responses))
+        self.assertEqual(instance.health.requests, 4)
+
+    def test_warm_up_limited(self):
+        instance = client(max_connections=2)
+        instance.session = FakeSession(concurrency=2)
+        self.assertEqual(instance.warm_up(8), 2)
+
+    def test_warm_up_none(self):
+        instance = client(max_connections=2)
+        instance.session = FakeSession()
+        self.assertEqual(instance.warm_up(0), 0)
+        self.assertEqual(instance.session.responses, [])
+
+    def test_warm_up_failure(self):
+        instance = client(max_connections=2)
+        instance.session = FakeSession(
+            error=requests.ConnectionError(), concurrency=2)
+        self.assertEqual(instance.warm_up(), 0)
+        self.assertEqual(instance.health.failures, 2)
+
+    def test_keep_alive(self):
+        instance = client(max_connections=1)
+        instance.session = FakeSession()
+        with instance.keep_alive(0.01) as keep_alive:
+            for _ in range(500):
+                if len(instance.session.responses) >= 2:
+                    break
+                time.sleep(0.01)
+        self.assertFalse(keep_alive.running)
+        self.assertGreaterEqual(len(instance.session.responses), 2)
+
+    def test_keep_alive_survives_errors(self):
+        calls = []
+
+        def probe():
+            calls.append(None)
+            raise RuntimeError()
+
+        keep_alive = KeepAlive(probe, 0.01)
+        for _ in range(500):
+            if len(calls) >= 2:
+                break
+            time.sleep(0.01)
+        keep_alive.stop()
+        self.assertGreaterEqual(len(calls), 2)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+AIS.py - A Python interface for the Swisscom All-in Signing Service.
+
+:copyright: (c) 2016 by Camptocamp
+:license: AGPLv3, see README and LICENSE for more details
+
+"""
+import json
+
+from common import my_vcr, fixture_path, BaseCase
+
+from AIS import AIS, Deadline, DeadlineExceeded, PDF
+from AIS.deadline import timeout_for
+
+
+PAYLOAD = json.dumps({
+    'SignRequest': {'OptionalInputs': {'ClaimedIdentity': {'Name': 'X:Y'}}}
+})
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestDeadline(BaseCase):
+
+    def test_remaining(self):
+        clock = FakeClock()
+        deadline = Deadline(10, clock=clock)
+        self.assertEqual(deadline.remaining, 10)
+        clock.now = 4
+        self.assertEqual(deadline.check(), 6)
+        self.assertFalse(deadline.expired)
+        clock.now = 12
+        self.assertTrue(deadline.expired)
+        with self.assertRaises(DeadlineExceeded):
+            deadline.check()
+
+    def test_of(self):
+        deadline = Deadline(1)
+        self.assertIs(Deadline.of(deadline), deadline)
+        self.assertIsNone(Deadline.of(None))
+        self.assertIsInstance(Deadline.of(2.5), Deadline)
+
+
+class TestTimeout(BaseCase):
+
+    def test_without_deadline(self):
+        self.assertEqual(timeout_for(), (10, 5))
+        connect, read = timeout_for(101)
+        self.assertEqual(connect, 10)
+        self.assertAlmostEqual(read, 10)
+
+    def test_with_deadline(self):
+        clock = FakeClock()
+        deadline = Deadline(100, clock=clock)
+        self.assertEqual(timeout_for(1, deadline), (10, 5))
+
+        clock.now = 98
+        connect, read = timeout_for(1000, deadline)
+        self.assertAlmostEqual(connect, 0.6)
+        self.assertAlmostEqual(read, 1.4)
+
+        clock.now = 100
+        with self.assertRaises(DeadlineExceeded):
+            timeout_for(1, deadline)
+
+
+class TestSigningWithDeadline(BaseCase):
+
+    def setUp(self):
+        self.instance = AIS('bonnie', 'the_secret',
+                            fixture_path('test.crt'),
+                            fixture_path('test.key'))
+
+    def test_sign_one_pdf(self):
+        pdf = PDF(fixture_path('one.pdf'))
+        with my_vcr.use_cassette('sign_unprepared_pdf'):
+            self.instance.sign_one_pdf(pdf, deadline=30)
+
+    def test_response_after_deadline(self):
+        # the deadline is created at 0, the timeouts are derived at 5
+        # and the response arrives at 15
+        times = iter([0.0, 5.0, 15.0])
+        deadline = Deadline(10, clock=lambda: next(times))
+        with my_vcr.use_cassette('sign_unprepared_pdf'):
+            # the late response is returned, the signature is valid
+            sign_resp = self.instance.post(PAYLOAD, deadline=deadline)
+            self.assertIn('Result', sign_resp)
+
+            # but no further request is sent
+            with self.assertRaises(DeadlineExceeded):
+                self.instance.post(PAYLOAD, deadline=deadline)
+
+    def test_sign_batch_expired(self):
+        clock = FakeClock()
+        deadline = Deadline(0, clock=clock)
+        pdfs = [PDF(fixture_path(filename))
+                for filename in ["one.pdf", "two.pdf"]]
+        with self.assertRaises(DeadlineExceeded):
+            self.instance.sign_batch(pdfs, deadline=deadline)
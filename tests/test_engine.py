@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+AIS.py - A Python interface for the Swisscom All-in Signing Service.
+
+:copyright: (c) 2016 by Camptocamp
+:license: AGPLv3, see README and LICENSE for more details
+
+"""
+from os import listdir
+from os.path import join
+from shutil import copyfile
+from tempfile import TemporaryDirectory
+
+from common import my_vcr, fixture_path, BaseCase
+
+from AIS import AIS, SignatureTooLarge, SigningEngine
+from AIS.engine import _embed_file
+
+
+class TestSigningEngine(BaseCase):
+
+    def setUp(self):
+        self.client = AIS('bonnie', 'the_secret',
+                          fixture_path('test.crt'), fixture_path('test.key'))
+        self.directory = TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def files(self, *filenames):
+        return [
+            (fixture_path(filename), join(self.directory.name, filename))
+            for filename in filenames
+        ]
+
+    def test_sign_files(self):
+        files = self.files('one.pdf', 'two.pdf', 'three.pdf')
+        engine = SigningEngine(self.client, processes=2, batch_size=3)
+        with my_vcr.use_cassette('sign_batch') as cassette:
+            engine.sign_files(files)
+
+        self.assertEqual(cassette.play_count, 1)
+        for input_path, output_path in files:
+            with open(input_path, 'rb') as fp:
+                original = fp.read()
+            with open(output_path, 'rb') as fp:
+                signed = fp.read()
+            self.assertTrue(signed.startswith(original))
+            self.assertIn(b'/Contents <3082', signed)
+
+    def test_sign_files_in_place(self):
+        files = self.files('one.pdf', 'two.pdf', 'three.pdf')
+        originals = {}
+        for input_path, output_path in files:
+            copyfile(input_path, output_path)
+            with open(input_path, 'rb') as fp:
+                originals[output_path] = fp.read()
+
+        engine = SigningEngine(self.client, processes=2, batch_size=3)
+        with my_vcr.use_cassette('sign_batch'):
+            engine.sign_files([(path, path) for _, path in files])
+
+        self.assertEqual(
+            sorted(listdir(self.directory.name)),
+            ['one.pdf', 'three.pdf', 'two.pdf']
+        )
+        for path, original in originals.items():
+            with open(path, 'rb') as fp:
+                signed = fp.read()
+            self.assertTrue(signed.startswith(original))
+            self.assertIn(b'/Contents <3082', signed)
+
+    def test_sign_no_files(self):
+        SigningEngine(self.client, processes=1).sign_files([])
+
+    def test_prepare_error(self):
+        files = [(fixture_path('test.crt'), join(self.directory.name, 'x'))]
+        with self.assertRaises(Exception):
+            SigningEngine(self.client, processes=1).sign_files(files)
+
+    def test_prepare_error_leaves_no_files(self):
+        files = self.files('one.pdf', 'two.pdf')
+        files.append(
+            (fixture_path('test.crt'), join(self.directory.name, 'x')))
+        with self.assertRaises(Exception):
+            SigningEngine(self.client, processes=2).sign_files(files)
+        self.assertEqual(listdir(self.directory.name), [])
+
+    def test_embed_too_large(self):
+        path = join(self.directory.name, 'x')
+        with open(path, 'wb') as fp:
+            fp.write(b'<' + b'0' * 8 + b'>')
+        output_path = join(self.directory.name, 'y')
+        with self.assertRaises(SignatureTooLarge):
+            _embed_file(path, output_path, 0, 10, b'0' * 5)
+        self.assertEqual(listdir(self.directory.name), [])
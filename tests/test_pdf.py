@@ -6,11 +6,18 @@ AIS.py - A Python interface for the Swisscom All-in Signing Service.
 :license: AGPLv3, see README and LICENSE for more details
 
 """
-from common import fixture_path, BaseCase
+from common import fixture_path, sign_locally, validate_signature
+from common import BaseCase
 from io import BytesIO
 from tempfile import TemporaryFile
+from unittest import mock
 
-from AIS import PDF, SignatureTooLarge
+from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
+from pyhanko.pdf_utils.reader import PdfFileReader
+from pyhanko.sign.fields import MDPPerm
+from pyhanko.sign.validation import validate_pdf_signature
+
+from AIS import MultiSignaturePDF, PDF, SignatureTooLarge
 
 
 class WeirdIO:
@@ -38,9 +45,14 @@ class TestPDF(BaseCase):
 
     def test_write_signature(self):
         pdf = PDF(fixture_path('one.pdf'))
+        self.assertFalse(pdf.signed)
         pdf.digest()
         pdf.write_signature(b'0')
         assert pdf.out_stream is not None
+        self.assertTrue(pdf.signed)
+
+        pdf.reset()
+        self.assertFalse(pdf.signed)
 
     def test_write_signature_too_large(self):
         pdf = PDF(fixture_path('one.pdf'), sig_size=64)
@@ -102,3 +114,197 @@ class TestPDF(BaseCase):
             pdf.digest()
             pdf.write_signature(b'0')
             assert pdf.out_stream is not in_stream
+
+    def test_write_signature_contents(self):
+        with open(fixture_path('one.pdf'), mode='rb') as fp:
+            in_stream = BytesIO(fp.read())
+
+        pdf = PDF(in_stream, out_stream=BytesIO())
+        pdf.digest()
+        pdf.write_signature(b'\xab\xcd')
+        start = pdf.prepared_digest.reserved_region_start
+        end = pdf.prepared_digest.reserved_region_end
+        data = pdf.out_stream.getvalue()
+        assert data[start:start + 6] == b'<abcd0'
+        assert data[start + 5:end - 1] == b'0' * (pdf.sig_size - 4)
+
+        in_stream.seek(0)
+        with TemporaryFile() as out_stream:
+            pdf = PDF(in_stream, out_stream=out_stream)
+            pdf.digest()
+            pdf.write_signature(b'\xab\xcd')
+            out_stream.seek(start)
+            assert out_stream.read(end - start) == data[start:end]
+
+    def test_write_signature_rewinds_out_stream(self):
+        with open(fixture_path('one.pdf'), mode='rb') as fp:
+            in_stream = BytesIO(fp.read())
+
+        out_stream = BytesIO()
+        pdf = PDF(in_stream, out_stream=out_stream)
+        pdf.digest()
+        pdf.write_signature(b'\xab')
+        self.assertEqual(out_stream.tell(), 0)
+        data = out_stream.read()
+        self.assertEqual(data, out_stream.getvalue())
+
+        in_stream.seek(0)
+        with TemporaryFile() as out_stream:
+            pdf = PDF(in_stream, out_stream=out_stream)
+            pdf.digest()
+            pdf.write_signature(b'\xab')
+            self.assertEqual(out_stream.tell(), 0)
+            self.assertEqual(len(out_stream.read()), len(data))
+
+    def test_write_signature_twice(self):
+        with open(fixture_path('one.pdf'), mode='rb') as fp:
+            in_stream = BytesIO(fp.read())
+
+        pdf = PDF(in_stream, out_stream=BytesIO())
+        pdf.digest()
+        pdf.write_signature(b'\xab' * 10)
+        pdf.write_signature(b'\xcd' * 2)
+        start = pdf.prepared_digest.reserved_region_start
+        end = pdf.prepared_digest.reserved_region_end
+        data = pdf.out_stream.getvalue()
+        assert data[start:end] == b'<cdcd' + b'0' * (pdf.sig_size - 4) + b'>'
+
+        in_stream.seek(0)
+        with TemporaryFile() as out_stream:
+            pdf = PDF(in_stream, out_stream=out_stream)
+            pdf.digest()
+            pdf.write_signature(b'\xab' * 10)
+            pdf.write_signature(b'\xcd' * 2)
+            out_stream.seek(start)
+            assert out_stream.read(end - start) == data[start:end]
+
+    def test_adaptive_sig_size_defaults(self):
+        pdf = PDF(fixture_path('one.pdf'), sig_size=None)
+        self.assertTrue(pdf.adaptive_sig_size)
+        self.assertEqual(pdf.sig_size, 64*1024)
+        self.assertFalse(PDF(fixture_path('one.pdf')).adaptive_sig_size)
+
+    def test_reset_in_place(self):
+        with open(fixture_path('one.pdf'), mode='rb') as fp:
+            original = fp.read()
+
+        pdf = PDF(inout_stream=BytesIO(original), sig_size=64)
+        pdf.digest()
+        with self.assertRaises(SignatureTooLarge):
+            pdf.write_signature(b'0'*42)
+
+        pdf.reset(sig_size=128)
+        self.assertEqual(pdf.out_stream.getvalue(), original)
+        self.assertEqual(pdf.sig_size, 128)
+        pdf.digest()
+        pdf.write_signature(b'0'*42)
+        self.assertTrue(pdf.out_stream.getvalue().startswith(original))
+
+    def test_reset_out_stream(self):
+        with open(fixture_path('one.pdf'), mode='rb') as fp:
+            pdf = PDF(fp, sig_size=64)
+            pdf.digest()
+            signed_size = len(pdf.out_stream.getvalue())
+
+            pdf.reset(sig_size=128)
+            self.assertEqual(pdf.out_stream.getvalue(), b'')
+            pdf.digest()
+            pdf.write_signature(b'0'*42)
+            self.assertEqual(len(pdf.out_stream.getvalue()),
+                             signed_size + 64)
+
+    def test_spill(self):
+        pdf = PDF(fixture_path('one.pdf'))
+        pdf.digest()
+        prepared = pdf.out_stream.getvalue()
+        self.assertEqual(pdf.buffered_size, len(prepared))
+
+        self.assertEqual(pdf.spill(), len(prepared))
+        self.assertEqual(pdf.buffered_size, 0)
+        self.assertNotIsInstance(pdf.out_stream, BytesIO)
+        self.assertEqual(pdf.signed_bytes(), prepared)
+
+        pdf.write_signature(b'0')
+        self.assertEqual(len(pdf.signed_bytes()), len(prepared))
+        self.assertNotEqual(pdf.signed_bytes(), prepared)
+
+    def test_spill_reset(self):
+        with open(fixture_path('one.pdf'), mode='rb') as fp:
+            original = fp.read()
+
+        pdf = PDF(fixture_path('one.pdf'), sig_size=64)
+        pdf.digest()
+        pdf.spill()
+        pdf.reset(sig_size=128)
+        self.assertEqual(pdf.signed_bytes(), original)
+        pdf.digest()
+        pdf.write_signature(b'0'*42)
+        self.assertTrue(pdf.signed_bytes().startswith(original))
+
+    def test_spill_callers_stream(self):
+        with open(fixture_path('one.pdf'), mode='rb') as fp:
+            in_stream = BytesIO(fp.read())
+
+        pdf = PDF(inout_stream=in_stream)
+        pdf.digest()
+        self.assertEqual(pdf.spill(), 0)
+        self.assertIs(pdf.out_stream, in_stream)
+
+    def test_compact(self):
+        regular = PDF(fixture_path('one.pdf'), sig_size=1024)
+        regular.digest()
+        compact = PDF(fixture_path('one.pdf'), sig_size=1024, compact=True)
+        compact.digest()
+        self.assertLess(len(compact.signed_bytes()),
+                        len(regular.signed_bytes()))
+        self.assertIn(b'/Type /XRef', compact.signed_bytes())
+
+        compact.reset(sig_size=8*1024)
+        sign_locally(compact)
+        status = validate_signature(compact)
+        self.assertTrue(status.intact)
+        self.assertTrue(status.valid)
+
+    def test_compact_unsupported(self):
+        # a pyHanko release without the private hook
+        with mock.patch.object(IncrementalPdfFileWriter,
+                               'prepare_object_stream', None):
+            pdf = PDF(fixture_path('one.pdf'), sig_size=8*1024,
+                      compact=True)
+            sign_locally(pdf)
+        self.assertNotIn(b'/Type /XRef', pdf.signed_bytes())
+        status = validate_signature(pdf)
+        self.assertTrue(status.intact)
+        self.assertTrue(status.valid)
+
+    def test_multiple_signatures(self):
+        document = MultiSignaturePDF(fixture_path('one.pdf'),
+                                     sig_names=['First', 'Second'],
+                                     sig_size=8*1024)
+        while document.pending is not None:
+            sign_locally(document.pending)
+            document.mark_signed()
+
+        self.assertIsNone(document.pending)
+        reader = PdfFileReader(BytesIO(document.signed_bytes()))
+        signatures = reader.embedded_signatures
+        self.assertEqual([s.field_name for s in signatures],
+                         ['First', 'Second'])
+        for signature in signatures:
+            status = validate_pdf_signature(signature)
+            self.assertTrue(status.intact)
+            self.assertTrue(status.valid)
+            self.assertTrue(status.docmdp_ok)
+
+    def test_multiple_signatures_no_changes(self):
+        with self.assertRaises(ValueError):
+            MultiSignaturePDF(fixture_path('one.pdf'),
+                              sig_names=['First', 'Second'],
+                              docmdp_perms=MDPPerm.NO_CHANGES)
+        with self.assertRaises(ValueError):
+            MultiSignaturePDF(fixture_path('one.pdf'), sig_names=[])
+
+    def test_approval_signature(self):
+        pdf = PDF(fixture_path('one.pdf'), docmdp_perms=None)
+        pdf.digest()
+        self.assertNotIn(b'/DocMDP', pdf.signed_bytes())
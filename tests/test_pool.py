@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+AIS.py - A Python interface for the Swisscom All-in Signing Service.
+
+:copyright: (c) 2016 by Camptocamp
+:license: AGPLv3, see README and LICENSE for more details
+
+"""
+import threading
+
+import requests
+
+from common import my_vcr, fixture_path, BaseCase
+
+from AIS import AIS, AISPool, PDF, SignatureTooLarge
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakePDF:
+    def __init__(self, name):
+        self.name = name
+        self.signed = False
+
+
+class FakeClient:
+    def __init__(self, error=None, sign_before_error=0):
+        self.error = error
+        self.sign_before_error = sign_before_error
+        self.signed = []
+
+    def sign_one_pdf(self, pdf, deadline=None):
+        if self.error is not None:
+            raise self.error
+        self.signed.append(pdf)
+
+    def sign_batch(self, pdfs, deadline=None):
+        if self.error is not None:
+            for pdf in pdfs[:self.sign_before_error]:
+                pdf.signed = True
+            raise self.error
+        for pdf in pdfs:
+            pdf.signed = True
+        self.signed.extend(pdfs)
+
+
+class TestAISPool(BaseCase):
+
+    def test_requires_clients(self):
+        with self.assertRaises(ValueError):
+            AISPool([])
+
+    def test_spreads_requests(self):
+        clients = [FakeClient(), FakeClient()]
+        pool = AISPool(clients)
+        for index in range(4):
+            pool.sign_one_pdf(index)
+
+        self.assertEqual(clients[0].signed, [0, 2])
+        self.assertEqual(clients[1].signed, [1, 3])
+
+    def test_least_outstanding(self):
+        clients = [FakeClient(), FakeClient()]
+        pool = AISPool(clients)
+        pool.members[0].outstanding = 1
+        pool.sign_one_pdf('a')
+        pool.sign_one_pdf('b')
+        self.assertEqual(clients[1].signed, ['a', 'b'])
+
+    def test_retry_and_eject(self):
+        clock = FakeClock()
+        broken = FakeClient(requests.ConnectionError())
+        working = FakeClient()
+        pool = AISPool([broken, working], max_failures=2,
+                       ejection_time=10, clock=clock)
+
+        for index in range(4):
+            pool.sign_one_pdf(index)
+
+        self.assertEqual(working.signed, [0, 1, 2, 3])
+        self.assertEqual(pool.members[0].errors, 2)
+        self.assertTrue(pool.members[0].ejected(clock.now))
+
+        # after the ejection the member is tried again
+        clock.now = 11
+        broken.error = None
+        pool.sign_one_pdf(4)
+        self.assertEqual(broken.signed, [4])
+        self.assertEqual(pool.members[0].failures, 0)
+
+    def test_all_members_fail(self):
+        pool = AISPool([FakeClient(requests.ConnectionError()),
+                        FakeClient(requests.ConnectionError())])
+        with self.assertRaises(requests.ConnectionError):
+            pool.sign_one_pdf('a')
+
+        self.assertEqual([m.outstanding for m in pool.members], [0, 0])
+
+    def test_document_errors_not_retried(self):
+        failing = FakeClient(SignatureTooLarge(10))
+        other = FakeClient()
+        pool = AISPool([failing, other])
+        with self.assertRaises(SignatureTooLarge):
+            pool.sign_one_pdf('a')
+
+        self.assertEqual(other.signed, [])
+        self.assertEqual(pool.members[0].errors, 0)
+
+    def test_sign_batch_chunks(self):
+        clients = [FakeClient(), FakeClient()]
+        pool = AISPool(clients)
+        pdfs = [FakePDF(index) for index in range(5)]
+        pool.sign_batch(pdfs, chunk_size=2)
+
+        signed = clients[0].signed + clients[1].signed
+        self.assertEqual(sorted(pdf.name for pdf in signed), [0, 1, 2, 3, 4])
+
+    def test_sign_batch_retry_skips_signed(self):
+        # the first chunk was signed before the request of the second
+        # chunk failed
+        broken = FakeClient(requests.ConnectionError(), sign_before_error=2)
+        working = FakeClient()
+        pool = AISPool([broken, working])
+
+        pdfs = [FakePDF(index) for index in range(4)]
+        pool.sign_batch(pdfs)
+        self.assertEqual([pdf.name for pdf in working.signed], [2, 3])
+        self.assertTrue(all(pdf.signed for pdf in pdfs))
+
+    def test_concurrent_requests(self):
+        clients = [FakeClient(), FakeClient()]
+        pool = AISPool(clients)
+        threads = [
+            threading.Thread(target=pool.sign_one_pdf, args=(index,))
+            for index in range(20)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(clients[0].signed + clients[1].signed), 20)
+        self.assertEqual(sum(m.requests for m in pool.members), 20)
+
+    def test_failover_to_real_client(self):
+        broken = FakeClient(requests.ConnectionError())
+        working = AIS('bonnie', 'the_secret',
+                      fixture_path('test.crt'), fixture_path('test.key'))
+        pool = AISPool([broken, working])
+
+        pdf = PDF(fixture_path('one.pdf'))
+        with my_vcr.use_cassette('sign_unprepared_pdf'):
+            pool.sign_one_pdf(pdf)
+
+        self.assertIsNotNone(working.last_request_id)
+        self.assertEqual(pool.members[0].errors, 1)
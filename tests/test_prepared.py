@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+AIS.py - A Python interface for the Swisscom All-in Signing Service.
+
+:copyright: (c) 2016 by Camptocamp
+:license: AGPLv3, see README and LICENSE for more details
+
+"""
+from common import my_vcr, fixture_path, BaseCase
+from io import BytesIO
+from tempfile import TemporaryFile
+
+from AIS import AIS, PDF, PreparedPDF, SignatureTooLarge
+from AIS import prepare_pdf, prepare_pdfs
+
+
+class TestPreparedPDF(BaseCase):
+
+    def test_prepare_pdf(self):
+        prepared = prepare_pdf(fixture_path('one.pdf'), sig_size=1024)
+        pdf = PreparedPDF(inout_stream=prepared)
+        self.assertEqual(pdf.sig_size, 1024)
+        self.assertFalse(pdf.adaptive_sig_size)
+
+    def test_prepare_pdfs(self):
+        prepared = list(prepare_pdfs(
+            [fixture_path('one.pdf'), fixture_path('two.pdf')],
+            sig_size=1024
+        ))
+        self.assertEqual(len(prepared), 2)
+        for stream in prepared:
+            self.assertEqual(PreparedPDF(stream).sig_size, 1024)
+
+    def test_same_as_pdf(self):
+        pdf = PDF(fixture_path('one.pdf'), sig_size=1024)
+        digest = pdf.digest()
+        prepared = BytesIO(pdf.out_stream.getvalue())
+
+        pdf.write_signature(b'\x30\x01')
+        prepared_pdf = PreparedPDF(inout_stream=prepared)
+        self.assertEqual(prepared_pdf.digest(), digest)
+        prepared_pdf.write_signature(b'\x30\x01')
+        self.assertEqual(prepared_pdf.out_stream.getvalue(),
+                         pdf.out_stream.getvalue())
+
+    def test_out_stream(self):
+        prepared = prepare_pdf(fixture_path('one.pdf'), sig_size=1024)
+        original = prepared.getvalue()
+        with TemporaryFile() as out_stream:
+            pdf = PreparedPDF(prepared, out_stream=out_stream)
+            digest = pdf.digest()
+            pdf.write_signature(b'\x30\x01')
+            self.assertIs(pdf.out_stream, out_stream)
+            self.assertEqual(prepared.getvalue(), original)
+
+            out_stream.seek(0)
+            self.assertEqual(
+                PreparedPDF(inout_stream=BytesIO(original)).digest(),
+                digest
+            )
+            self.assertNotEqual(out_stream.read(), original)
+
+    def test_prepare_compact(self):
+        prepared = prepare_pdf(fixture_path('one.pdf'), sig_size=1024,
+                               compact=True)
+        pdf = PreparedPDF(inout_stream=prepared)
+        self.assertEqual(pdf.sig_size, 1024)
+
+    def test_unprepared(self):
+        with self.assertRaises(ValueError):
+            PreparedPDF(fixture_path('one.pdf'))
+
+    def test_already_signed(self):
+        prepared = prepare_pdf(fixture_path('one.pdf'), sig_size=1024)
+        pdf = PreparedPDF(inout_stream=prepared)
+        pdf.digest()
+        pdf.write_signature(b'\x30\x01')
+        with self.assertRaises(ValueError):
+            PreparedPDF(inout_stream=BytesIO(prepared.getvalue()))
+
+    def test_signature_too_large(self):
+        prepared = prepare_pdf(fixture_path('one.pdf'), sig_size=64)
+        pdf = PreparedPDF(inout_stream=prepared)
+        pdf.digest()
+        with self.assertRaises(SignatureTooLarge):
+            pdf.write_signature(b'0'*42)
+
+    def test_sign_one_pdf(self):
+        client = AIS('bonnie', 'the_secret',
+                     fixture_path('test.crt'), fixture_path('test.key'))
+        pdf = PreparedPDF(prepare_pdf(fixture_path('one.pdf')))
+        with my_vcr.use_cassette('sign_unprepared_pdf'):
+            client.sign_one_pdf(pdf)
+
+        self.assertIsNotNone(client.last_request_id)
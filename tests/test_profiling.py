@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+AIS.py - A Python interface for the Swisscom All-in Signing Service.
+
+:copyright: (c) 2016 by Camptocamp
+:license: AGPLv3, see README and LICENSE for more details
+
+"""
+from io import StringIO
+import os
+from unittest import mock
+
+from common import fixture_path, sign_locally, BaseCase
+
+from AIS import PDF, Profiler, prepare_pdfs
+from AIS import profiling
+from AIS.profiling import profiler_from_env, size_bucket
+
+
+class TestProfiler(BaseCase):
+
+    def tearDown(self):
+        profiling._env_profiler = None
+
+    def test_size_bucket(self):
+        self.assertEqual(size_bucket(None), 'unknown')
+        self.assertEqual(size_bucket(1), '<= 64 KiB')
+        self.assertEqual(size_bucket(64*1024 + 1), '<= 256 KiB')
+        self.assertEqual(size_bucket(2**40), '> 64 MiB')
+
+    def test_phases(self):
+        profiler = Profiler()
+        pdf = PDF(fixture_path('one.pdf'))
+        with profiler.phase('ais.digest', pdf):
+            pdf.digest()
+        with profiler.phase('ais.embed', pdf):
+            sign_locally(pdf)
+        profiler.close()
+
+        digest = profiler.stats[('ais.digest', '<= 64 KiB')]
+        self.assertEqual(digest.documents, 1)
+        self.assertEqual(digest.profiled, 1)
+        self.assertGreater(digest.wall_time, 0)
+        self.assertGreater(digest.peak_memory, 0)
+        self.assertEqual(digest.total_peak_memory, digest.peak_memory)
+        self.assertIn(('ais.embed', '<= 64 KiB'), profiler.stats)
+
+        report = StringIO()
+        profiler.report(report)
+        lines = report.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith('phase'))
+        self.assertTrue(lines[1].startswith('ais.digest'))
+        self.assertTrue(lines[2].startswith('ais.embed'))
+        self.assertIn('Calls during ais.digest:', lines)
+        self.assertIn('Calls during ais.embed:', lines)
+
+    def test_concurrent_phases_are_only_timed(self):
+        profiler = Profiler()
+        pdf = PDF(fixture_path('one.pdf'))
+        with profiler.phase('ais.digest', pdf):
+            with profiler.phase('ais.embed', pdf):
+                pass
+        profiler.close()
+
+        embed = profiler.stats[('ais.embed', '<= 64 KiB')]
+        self.assertEqual(embed.documents, 1)
+        self.assertEqual(embed.profiled, 0)
+        self.assertNotIn('ais.embed', profiler.profiles)
+
+        report = StringIO()
+        profiler.report(report)
+        self.assertIn('Calls during ais.digest:', report.getvalue())
+
+    def test_without_cpu_and_memory(self):
+        profiler = Profiler(cpu=False, memory=False)
+        pdf = PDF(fixture_path('one.pdf'))
+        with profiler.phase('ais.digest', pdf):
+            pdf.digest()
+
+        digest = profiler.stats[('ais.digest', '<= 64 KiB')]
+        self.assertEqual(digest.documents, 1)
+        self.assertEqual(digest.profiled, 0)
+        self.assertEqual(profiler.profiles, {})
+
+    def test_prepare_pdfs(self):
+        profiler = Profiler(memory=False)
+        paths = [fixture_path('one.pdf'), fixture_path('two.pdf')]
+        list(prepare_pdfs(paths, profiler=profiler))
+
+        documents = sum(
+            stats.documents for (phase, _), stats in profiler.stats.items()
+            if phase == 'ais.digest'
+        )
+        self.assertEqual(documents, 2)
+
+    def test_from_env(self):
+        with mock.patch.dict(os.environ, {'AIS_PROFILE': ''}):
+            self.assertIsNone(profiler_from_env())
+
+        with mock.patch.dict(os.environ, {'AIS_PROFILE': '1'}), \
+                mock.patch('atexit.register') as register:
+            profiler = profiler_from_env()
+            self.assertIsInstance(profiler, Profiler)
+            self.assertIs(profiler_from_env(), profiler)
+            register.assert_called_once()
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+AIS.py - A Python interface for the Swisscom All-in Signing Service.
+
+:copyright: (c) 2016 by Camptocamp
+:license: AGPLv3, see README and LICENSE for more details
+
+"""
+import threading
+import time
+
+from common import my_vcr, fixture_path, BaseCase
+
+from AIS import AIS, PDF, SigningScheduler
+
+
+class BlockingClient:
+    """Records the order of requests, blocking until released."""
+
+    def __init__(self):
+        self.order = []
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def _run(self, name):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        self.release.wait(5)
+        with self.lock:
+            self.running -= 1
+            self.order.append(name)
+
+    def wait_running(self, count):
+        for _ in range(500):
+            if self.running >= count:
+                return
+            time.sleep(0.01)
+        raise AssertionError('requests did not start')
+
+    def sign_one_pdf(self, pdf, deadline=None):
+        if pdf == 'error':
+            raise ValueError(pdf)
+        self._run(pdf)
+
+    def sign_batch(self, pdfs, deadline=None):
+        if 'error' in pdfs:
+            raise ValueError(pdfs)
+        self._run(tuple(pdfs))
+
+
+class TestSigningScheduler(BaseCase):
+
+    def test_invalid_reservation(self):
+        with self.assertRaises(ValueError):
+            SigningScheduler(BlockingClient(), max_concurrency=1,
+                             reserved_interactive=1)
+
+    def test_interactive_first(self):
+        client = BlockingClient()
+        with SigningScheduler(client, max_concurrency=2,
+                              reserved_interactive=1,
+                              bulk_chunk_size=1) as scheduler:
+            bulk = scheduler.submit_batch(['a', 'b', 'c'])
+            client.wait_running(1)
+            self.assertEqual(scheduler.pending, 2)
+
+            # the interactive request runs next to the bulk chunk
+            one = scheduler.submit_one('x')
+            client.wait_running(2)
+            self.assertEqual(scheduler.pending, 2)
+            client.release.set()
+            one.result(5)
+            bulk.result(5)
+
+        self.assertEqual(client.max_running, 2)
+        self.assertEqual(len(client.order), 4)
+
+    def test_bulk_uses_spare_capacity(self):
+        client = BlockingClient()
+        with SigningScheduler(client, max_concurrency=3,
+                              reserved_interactive=1,
+                              bulk_chunk_size=1) as scheduler:
+            bulk = scheduler.submit_batch(['a', 'b', 'c', 'd'])
+            client.release.set()
+            bulk.result(5)
+
+        self.assertEqual(len(client.order), 4)
+        self.assertLessEqual(client.max_running, 2)
+
+    def test_errors(self):
+        client = BlockingClient()
+        client.release.set()
+        with SigningScheduler(client, bulk_chunk_size=1) as scheduler:
+            with self.assertRaises(ValueError):
+                scheduler.submit_one('error').result(5)
+            with self.assertRaises(ValueError):
+                scheduler.submit_batch(['a', 'error']).result(5)
+
+    def test_empty_batch(self):
+        with SigningScheduler(BlockingClient()) as scheduler:
+            self.assertIsNone(scheduler.submit_batch([]).result(5))
+
+    def test_shutdown(self):
+        client = BlockingClient()
+        client.release.set()
+        scheduler = SigningScheduler(client)
+        future = scheduler.submit_one('a')
+        scheduler.shutdown()
+        self.assertTrue(future.done())
+        with self.assertRaises(RuntimeError):
+            scheduler.submit_one('b')
+
+    def test_sign_with_client(self):
+        client = AIS('bonnie', 'the_secret',
+                     fixture_path('test.crt'), fixture_path('test.key'))
+        pdf = PDF(fixture_path('one.pdf'))
+        with SigningScheduler(client) as scheduler:
+            with my_vcr.use_cassette('sign_unprepared_pdf'):
+                scheduler.submit_one(pdf).result(5)
+
+        self.assertIsNotNone(client.last_request_id)
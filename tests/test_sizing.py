@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+AIS.py - A Python interface for the Swisscom All-in Signing Service.
+
+:copyright: (c) 2016 by Camptocamp
+:license: AGPLv3, see README and LICENSE for more details
+
+"""
+from common import my_vcr, fixture_path, BaseCase
+
+from AIS import AIS, PDF, SignatureSizer, SignatureTooLarge
+
+
+class TestSignatureSizer(BaseCase):
+
+    def test_initial(self):
+        self.assertEqual(SignatureSizer().reserve(), 64*1024)
+        self.assertEqual(SignatureSizer(initial=1000).reserve(), 1000)
+
+    def test_reserve(self):
+        sizer = SignatureSizer(margin=0.5, granularity=100)
+        sizer.observe(1000)
+        self.assertEqual(sizer.reserve(), 1500)
+        sizer.observe(1010)
+        self.assertEqual(sizer.reserve(), 1600)
+        sizer.observe(900)
+        self.assertEqual(sizer.reserve(), 1600)
+
+    def test_window(self):
+        sizer = SignatureSizer(margin=0, granularity=1, window=2)
+        sizer.observe(2000)
+        sizer.observe(1000)
+        sizer.observe(1000)
+        self.assertEqual(sizer.reserve(), 1000)
+
+
+class TestAdaptiveSigning(BaseCase):
+
+    def client(self, sizer=None):
+        return AIS('bonnie', 'the_secret',
+                   fixture_path('test.crt'), fixture_path('test.key'),
+                   sig_sizer=sizer)
+
+    def test_sizer_learns_signature_size(self):
+        sizer = SignatureSizer()
+        client = self.client(sizer)
+        pdf = PDF(fixture_path('one.pdf'), sig_size=None)
+        with my_vcr.use_cassette('sign_unprepared_pdf'):
+            client.sign_one_pdf(pdf)
+
+        self.assertEqual(pdf.sig_size, 64*1024)
+        self.assertLess(sizer.reserve(), 64*1024)
+
+    def test_resize_and_sign_again(self):
+        sizer = SignatureSizer(initial=1024)
+        client = self.client(sizer)
+        pdf = PDF(fixture_path('one.pdf'), sig_size=None)
+        with my_vcr.use_cassette('sign_unprepared_pdf',
+                                 allow_playback_repeats=True):
+            client.sign_one_pdf(pdf)
+
+        self.assertEqual(pdf.sig_size, sizer.reserve())
+        self.assertGreater(pdf.sig_size, 1024)
+
+    def test_resize_batch(self):
+        sizer = SignatureSizer(initial=1024)
+        client = self.client(sizer)
+        pdfs = [PDF(fixture_path(filename), sig_size=None)
+                for filename in ["one.pdf", "two.pdf", "three.pdf"]]
+        with my_vcr.use_cassette('sign_batch',
+                                 allow_playback_repeats=True):
+            client.sign_batch(pdfs)
+
+        for pdf in pdfs:
+            self.assertGreater(pdf.sig_size, 1024)
+
+    def test_fixed_size_not_resized(self):
+        client = self.client(SignatureSizer(initial=1024))
+        pdf = PDF(fixture_path('one.pdf'), sig_size=1024)
+        with self.assertRaises(SignatureTooLarge):
+            with my_vcr.use_cassette('sign_unprepared_pdf'):
+                client.sign_one_pdf(pdf)
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+AIS.py - A Python interface for the Swisscom All-in Signing Service.
+
+:copyright: (c) 2016 by Camptocamp
+:license: AGPLv3, see README and LICENSE for more details
+
+"""
+from io import BytesIO
+from tempfile import TemporaryFile
+from unittest import mock
+
+from pyhanko.pdf_utils.reader import PdfFileReader
+
+from common import my_vcr, fixture_path, sign_locally, validate_signature
+from common import BaseCase
+
+from AIS import AIS, PDF, PreparedPDF, TemplateCache
+from AIS.template import PDFTemplate, fingerprint
+
+
+class TestTemplateCache(BaseCase):
+
+    def test_reuses_template(self):
+        templates = TemplateCache()
+        for name in ('one.pdf', 'two.pdf', 'three.pdf'):
+            pdf = templates.pdf(fixture_path(name), sig_size=8*1024)
+            self.assertIsInstance(pdf, PreparedPDF)
+            self.assertEqual(pdf.sig_size, 8*1024)
+        # all fixtures have been rendered from the same template
+        self.assertEqual(len(templates), 1)
+
+    def test_same_as_pdf(self):
+        templates = TemplateCache()
+        templates.pdf(fixture_path('one.pdf'))
+        pdf = templates.pdf(fixture_path('two.pdf'))
+        pdf.digest()
+
+        expected = PDF(fixture_path('two.pdf'))
+        expected.digest()
+        self.assertEqual(pdf.prepared_digest.reserved_region_start,
+                         expected.prepared_digest.reserved_region_start)
+        self.assertEqual(len(pdf.signed_bytes()),
+                         len(expected.signed_bytes()))
+
+    def test_valid_signature(self):
+        templates = TemplateCache()
+        templates.pdf(fixture_path('one.pdf'))
+        pdf = templates.pdf(fixture_path('three.pdf'))
+        sign_locally(pdf)
+
+        status = validate_signature(pdf)
+        self.assertTrue(status.intact)
+        self.assertTrue(status.valid)
+
+    def test_out_stream(self):
+        templates = TemplateCache()
+        with TemporaryFile() as out_stream:
+            pdf = templates.pdf(fixture_path('one.pdf'),
+                                out_stream=out_stream)
+            pdf.digest()
+            self.assertIs(pdf.out_stream, out_stream)
+
+    def test_different_sig_name(self):
+        templates = TemplateCache()
+        templates.pdf(fixture_path('one.pdf'))
+        templates.pdf(fixture_path('one.pdf'), sig_name='Other')
+        self.assertEqual(len(templates), 2)
+
+    def test_max_templates(self):
+        templates = TemplateCache(max_templates=1)
+        templates.pdf(fixture_path('one.pdf'), sig_size=1024)
+        templates.pdf(fixture_path('one.pdf'), sig_size=2048)
+        self.assertEqual(len(templates), 1)
+
+    def test_modified_objects(self):
+        with open(fixture_path('one.pdf'), 'rb') as fp:
+            data = fp.read()
+        template = PDFTemplate.learn(data)
+        self.assertTrue(template.matches(PdfFileReader(BytesIO(data))))
+
+        # the same structure, but the page the field is added to differs
+        modified = BytesIO(data.replace(
+            b'/MediaBox [0 0 595 842]', b'/MediaBox [0 0 842 595]'))
+
+        reader = PdfFileReader(modified)
+        self.assertEqual(fingerprint(reader), template.fingerprint)
+        self.assertFalse(template.matches(reader))
+
+        templates = TemplateCache()
+        templates.pdf(fixture_path('one.pdf'))
+        modified.seek(0)
+        pdf = templates.pdf(modified)
+        sign_locally(pdf)
+        self.assertTrue(validate_signature(pdf).intact)
+
+    def test_miss_uses_pyhanko_output(self):
+        templates = TemplateCache()
+        with mock.patch.object(PDFTemplate, 'apply') as apply:
+            pdf = templates.pdf(fixture_path('one.pdf'))
+        apply.assert_not_called()
+        self.assertIsInstance(pdf, PreparedPDF)
+        self.assertEqual(len(templates), 1)
+
+        sign_locally(pdf)
+        self.assertTrue(validate_signature(pdf).intact)
+
+    def test_mismatch_keeps_template(self):
+        with open(fixture_path('one.pdf'), 'rb') as fp:
+            data = fp.read()
+        modified = data.replace(
+            b'/MediaBox [0 0 595 842]', b'/MediaBox [0 0 842 595]')
+
+        templates = TemplateCache()
+        templates.pdf(BytesIO(data))
+        template, = templates._templates.values()
+
+        templates.pdf(BytesIO(modified))
+        self.assertEqual(list(templates._templates.values()), [template])
+
+        # documents of the known template still use it
+        with mock.patch.object(PDFTemplate, 'apply',
+                               autospec=True,
+                               side_effect=PDFTemplate.apply) as apply:
+            pdf = templates.pdf(fixture_path('two.pdf'))
+        apply.assert_called_once()
+        self.assertIs(apply.call_args[0][0], template)
+        sign_locally(pdf)
+        self.assertTrue(validate_signature(pdf).intact)
+
+    def test_sign_one_pdf(self):
+        client = AIS('bonnie', 'the_secret',
+                     fixture_path('test.crt'), fixture_path('test.key'))
+        templates = TemplateCache()
+        pdf = templates.pdf(fixture_path('one.pdf'))
+        with my_vcr.use_cassette('sign_unprepared_pdf'):
+            client.sign_one_pdf(pdf)
+
+        self.assertIsNotNone(client.last_request_id)
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+AIS.py - A Python interface for the Swisscom All-in Signing Service.
+
+:copyright: (c) 2016 by Camptocamp
+:license: AGPLv3, see README and LICENSE for more details
+
+"""
+from contextlib import contextmanager
+
+from common import my_vcr, fixture_path, BaseCase
+
+from AIS import AIS, PDF
+from AIS.tracing import get_tracer, set_tracer, span
+
+
+class FakeTracer:
+    def __init__(self):
+        self.spans = []
+
+    @contextmanager
+    def start_as_current_span(self, name, attributes=None):
+        self.spans.append((name, attributes or {}))
+        yield name
+
+
+class TestTracing(BaseCase):
+
+    def setUp(self):
+        self.tracer = FakeTracer()
+        set_tracer(self.tracer)
+        self.instance = AIS('bonnie', 'the_secret',
+                            fixture_path('test.crt'),
+                            fixture_path('test.key'))
+
+    def tearDown(self):
+        set_tracer(None)
+
+    def test_no_tracer(self):
+        set_tracer(None)
+        self.assertIsNone(get_tracer())
+        with span('ais.test') as current:
+            self.assertIsNone(current)
+
+    def test_span(self):
+        self.assertIs(get_tracer(), self.tracer)
+        with span('ais.test', {'a': 1}) as current:
+            self.assertEqual(current, 'ais.test')
+        self.assertEqual(self.tracer.spans, [('ais.test', {'a': 1})])
+
+    def test_sign_one_pdf(self):
+        pdf = PDF(fixture_path('one.pdf'))
+        with my_vcr.use_cassette('sign_unprepared_pdf'):
+            self.instance.sign_one_pdf(pdf)
+
+        names = [name for name, _ in self.tracer.spans]
+        self.assertEqual(names, [
+            'ais.pdf.prepare',
+            'ais.sign',
+            'ais.digest',
+            'ais.request.build',
+            'ais.request.http',
+            'ais.response.parse',
+            'ais.embed',
+        ])
+        attributes = dict(self.tracer.spans)
+        request_id = self.instance.last_request_id
+        self.assertEqual(attributes['ais.sign'], {
+            'ais.request_id': request_id,
+            'ais.batch_size': 1,
+        })
+        self.assertEqual(
+            attributes['ais.embed']['ais.request_id'], request_id)
+
+    def test_sign_batch(self):
+        pdfs = [PDF(fixture_path(filename))
+                for filename in ["one.pdf", "two.pdf", "three.pdf"]]
+        self.tracer.spans.clear()
+        with my_vcr.use_cassette('sign_batch'):
+            self.instance.sign_batch(pdfs)
+
+        digests = [
+            attributes['ais.document_index']
+            for name, attributes in self.tracer.spans
+            if name == 'ais.digest'
+        ]
+        embeds = [
+            attributes['ais.document_index']
+            for name, attributes in self.tracer.spans
+            if name == 'ais.embed'
+        ]
+        self.assertEqual(digests, [0, 1, 2])
+        self.assertEqual(sorted(embeds), [0, 1, 2])
+        self.assertEqual(self.tracer.spans[0][1]['ais.batch_size'], 3)
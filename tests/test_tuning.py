@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+AIS.py - A Python interface for the Swisscom All-in Signing Service.
+
+:copyright: (c) 2016 by Camptocamp
+:license: AGPLv3, see README and LICENSE for more details
+
+"""
+from common import my_vcr, fixture_path, BaseCase
+
+from AIS import AIS, BatchTuner, PDF
+
+
+def simulate(tuner, latency, batches=200):
+    for _ in range(batches):
+        size = tuner.batch_size()
+        tuner.record(size, latency(size), size * 1000)
+
+
+class TestBatchTuner(BaseCase):
+
+    def test_no_exploration(self):
+        tuner = BatchTuner(initial=10, explore_every=0)
+        for _ in range(20):
+            self.assertEqual(tuner.batch_size(), 10)
+
+    def test_exploration(self):
+        tuner = BatchTuner(initial=10, explore_every=2)
+        sizes = [tuner.batch_size() for _ in range(4)]
+        self.assertEqual(sizes, [10, 5, 10, 20])
+
+    def test_grows_while_throughput_improves(self):
+        # fixed overhead per request, so larger batches are better
+        tuner = BatchTuner(initial=10, max_size=640, latency_bound=100)
+        simulate(tuner, lambda size: 1 + size * 0.01)
+        self.assertEqual(tuner.current, 640)
+
+    def test_latency_bound(self):
+        tuner = BatchTuner(initial=10, max_size=640, latency_bound=2)
+        simulate(tuner, lambda size: 1 + size * 0.01)
+        self.assertEqual(tuner.current, 80)
+
+    def test_response_size_bound(self):
+        tuner = BatchTuner(initial=10, max_size=640, latency_bound=100,
+                           max_response_size=50000)
+        simulate(tuner, lambda size: 1 + size * 0.01)
+        self.assertEqual(tuner.current, 40)
+
+    def test_adapts_to_slower_service(self):
+        tuner = BatchTuner(initial=10, max_size=640, latency_bound=2,
+                           memory=20)
+        simulate(tuner, lambda size: 1 + size * 0.01)
+        self.assertEqual(tuner.current, 80)
+
+        simulate(tuner, lambda size: 1 + size * 0.04)
+        self.assertEqual(tuner.current, 20)
+
+    def test_backs_off_below_smallest_observed(self):
+        tuner = BatchTuner(initial=10, latency_bound=1)
+        tuner.record(10, 5, 0)
+        self.assertEqual(tuner.current, 5)
+
+    def test_timeouts_are_out_of_bounds(self):
+        tuner = BatchTuner(initial=50, max_size=100, explore_every=2)
+        for _ in range(100):
+            size = tuner.batch_size()
+            if size >= 100:
+                # the read timeout of this size is within the bound
+                tuner.record(size, 9.95, 0, failed=True)
+            else:
+                tuner.record(size, 7, size * 1000)
+        self.assertEqual(tuner.current, 50)
+        self.assertTrue(tuner.stats[100].failed)
+
+    def test_success_after_failure(self):
+        tuner = BatchTuner(initial=10, latency_bound=100)
+        tuner.record(10, 1, 1000)
+        tuner.record(20, 9.95, 0, failed=True)
+        self.assertEqual(tuner.current, 10)
+        tuner.record(20, 1, 2000)
+        self.assertEqual(tuner.current, 20)
+
+
+class TestSigningWithTuner(BaseCase):
+
+    def test_sign_batch_in_chunks(self):
+        tuner = BatchTuner(initial=1, explore_every=0)
+        instance = AIS('bonnie', 'the_secret',
+                       fixture_path('test.crt'), fixture_path('test.key'),
+                       batch_tuner=tuner)
+
+        pdfs = [PDF(fixture_path(filename))
+                for filename in ["one.pdf", "two.pdf"]]
+        with my_vcr.use_cassette('sign_unprepared_pdf',
+                                 allow_playback_repeats=True):
+            instance.sign_batch(pdfs)
+
+        self.assertEqual(list(tuner.stats), [1])
+        self.assertEqual(tuner.stats[1].count, 2)
+        self.assertGreater(tuner.stats[1].response_size, 0)
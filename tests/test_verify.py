@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+AIS.py - A Python interface for the Swisscom All-in Signing Service.
+
+:copyright: (c) 2016 by Camptocamp
+:license: AGPLv3, see README and LICENSE for more details
+
+"""
+from io import BytesIO
+
+from pyhanko.pdf_utils import generic
+from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
+from pyhanko.sign import signers
+
+from common import my_vcr, fixture_path, BaseCase
+
+from AIS import AIS, PDF
+from AIS.verify import validation_context, verify_pdf, verify_pdfs
+
+
+def signed_fixture(filename):
+    """Sign a fixture locally with the self-signed test certificate."""
+    signer = signers.SimpleSigner.load(
+        fixture_path('test.key'), fixture_path('test.crt'))
+    with open(fixture_path(filename), mode='rb') as fp:
+        writer = IncrementalPdfFileWriter(BytesIO(fp.read()))
+    out = signers.sign_pdf(
+        writer,
+        signers.PdfSignatureMetadata(field_name='Signature'),
+        signer=signer
+    )
+    return out.getvalue()
+
+
+class TestVerify(BaseCase):
+
+    def test_verify_pdf_trusted(self):
+        context = validation_context(trust_roots=[fixture_path('test.crt')])
+        result = verify_pdf(signed_fixture('one.pdf'), context, index=3)
+        self.assertEqual(result.index, 3)
+        self.assertTrue(result.ok)
+        self.assertTrue(result.docmdp_ok)
+        self.assertEqual(result.coverage, 'ENTIRE_FILE')
+        self.assertIsNone(result.error)
+
+    def test_verify_pdf_modified_after_signing(self):
+        writer = IncrementalPdfFileWriter(BytesIO(signed_fixture('one.pdf')))
+        page_ref, _ = writer.find_page_for_modification(0)
+        page = page_ref.get_object()
+        page['/MediaBox'] = generic.ArrayObject(
+            generic.NumberObject(value) for value in (0, 0, 100, 100))
+        writer.update_container(page)
+        out = BytesIO()
+        writer.write(out)
+
+        context = validation_context(trust_roots=[fixture_path('test.crt')])
+        result = verify_pdf(out.getvalue(), context)
+        self.assertTrue(result.intact)
+        self.assertTrue(result.valid)
+        self.assertTrue(result.trusted)
+        self.assertFalse(result.docmdp_ok)
+        self.assertEqual(result.coverage, 'ENTIRE_REVISION')
+        self.assertFalse(result.ok)
+
+    def test_verify_pdf_untrusted(self):
+        result = verify_pdf(signed_fixture('one.pdf'))
+        self.assertTrue(result.intact)
+        self.assertTrue(result.valid)
+        self.assertFalse(result.trusted)
+        self.assertFalse(result.ok)
+
+    def test_verify_unsigned(self):
+        result = verify_pdf(fixture_path('one.pdf'))
+        self.assertFalse(result.ok)
+        self.assertEqual(result.error, 'No signatures found')
+
+    def test_verify_garbage(self):
+        result = verify_pdf(b'garbage')
+        self.assertFalse(result.ok)
+        self.assertIsNotNone(result.error)
+
+    def test_verify_signed_pdf(self):
+        # the recorded signature doesn't match the document
+        client = AIS('bonnie', 'the_secret',
+                     fixture_path('test.crt'), fixture_path('test.key'))
+        pdf = PDF(fixture_path('one.pdf'))
+        with my_vcr.use_cassette('sign_unprepared_pdf'):
+            client.sign_one_pdf(pdf)
+
+        result = verify_pdf(pdf)
+        self.assertIsNone(result.error)
+        self.assertFalse(result.intact)
+
+    def test_verify_pdfs(self):
+        documents = [
+            signed_fixture('one.pdf'),
+            fixture_path('two.pdf'),
+            signed_fixture('three.pdf'),
+        ]
+        results = sorted(verify_pdfs(
+            documents,
+            trust_roots=[fixture_path('test.crt')],
+            max_workers=2,
+            max_pending=1
+        ), key=lambda result: result.index)
+        self.assertEqual([result.index for result in results], [0, 1, 2])
+        self.assertEqual([result.ok for result in results],
+                         [True, False, True])